@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+import sklearn
+from sklearn.svm import SVC
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import MinMaxScaler
+
+from utils.model_serving import ModelService
+from utils.preprocessing import MINMAX_COLUMNS
+from utils.student_schema import grade_class, kinesis_event, generate_students
+from utils.prediction_cache import PredictionCache
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000]
+DEFAULT_MODELS = ["svm", "rf", "dt", "xgb"]
+KINESIS_MAX_BATCH = 10_000
+
+
+def build_model(model_type, features, target):
+    if model_type == "svm":
+        model = SVC(C=1.0)
+    elif model_type == "rf":
+        model = RandomForestClassifier(max_depth=20, random_state=0)
+    elif model_type == "dt":
+        model = DecisionTreeClassifier(random_state=0)
+    elif model_type == "xgb":
+        from xgboost import XGBClassifier  # pylint: disable=import-outside-toplevel
+
+        model = XGBClassifier(max_depth=6, n_estimators=100, seed=0)
+    else:
+        raise ValueError(f"Unknown model type {model_type}")
+    return model.fit(features, target)
+
+
+def train_models(model_types, n_train=2_000):
+    students = generate_students(n_train, seed=0)
+    scaler = MinMaxScaler().fit(students[MINMAX_COLUMNS])
+    features = ModelService(None, scaler).preprocessing(students)
+    target = grade_class(students)
+    return scaler, {
+        model_type: build_model(model_type, features, target)
+        for model_type in model_types
+    }
+
+
+def timed(function, repeats):
+    function()  # warm-up
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def result(benchmark, seconds, *, rows, model=None, cache=False):
+    median = float(np.median(seconds))
+    return {
+        "benchmark": benchmark,
+        "model": model,
+        "cache": cache,
+        "batch_size": rows,
+        "repeats": len(seconds),
+        "seconds": {
+            "min": float(np.min(seconds)),
+            "median": median,
+            "max": float(np.max(seconds)),
+        },
+        "rows_per_second": rows / median if median else None,
+    }
+
+
+def bench_single_predict(model_service, students, calls, **labels):
+    latencies = []
+    for i in range(calls):
+        student = students[i % len(students)]
+        start = time.perf_counter()
+        model_service.predict(student)
+        latencies.append(time.perf_counter() - start)
+
+    entry = result("predict", latencies, rows=1, **labels)
+    entry["latency"] = {
+        f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)
+    }
+    return entry
+
+
+def bench_model(model_service, args, labels):
+    # A small pool of students, so the cache sees repeated records.
+    pool = generate_students(100, seed=1).to_dict("records")
+    results = [bench_single_predict(model_service, pool, args.single_calls, **labels)]
+
+    for batch_size in args.batch_sizes:
+        data = generate_students(batch_size, seed=batch_size)
+        if not labels["cache"]:
+            # batch_predict never goes through the cache.
+            seconds = timed(partial(model_service.batch_predict, data), args.repeats)
+            results.append(result("batch_predict", seconds, rows=batch_size, **labels))
+
+        if batch_size > KINESIS_MAX_BATCH:
+            continue
+        event = kinesis_event(data.to_dict("records"))
+        for batch_records in (False, True):
+            if not batch_records and batch_size > args.max_lambda_records:
+                continue
+            model_service.batch_records = batch_records
+            seconds = timed(partial(model_service.lambda_handler, event), args.repeats)
+            name = "batch_lambda_handler" if batch_records else "lambda_handler"
+            results.append(result(name, seconds, rows=batch_size, **labels))
+
+    return results
+
+
+def run_benchmarks(args):
+    scaler, models = train_models(args.models)
+    results = []
+
+    for batch_size in args.batch_sizes:
+        data = generate_students(batch_size, seed=batch_size)
+        model_service = ModelService(None, scaler)
+        seconds = timed(partial(model_service.preprocess_array, data), args.repeats)
+        results.append(result("preprocessing", seconds, rows=batch_size))
+
+    for model_type, model in models.items():
+        for cache in args.cache:
+            model_service = ModelService(
+                model, scaler, "bench", cache=PredictionCache() if cache else None
+            )
+            labels = {"model": model_type, "cache": cache}
+            results.extend(bench_model(model_service, args, labels))
+            print(f"Finished {model_type} (cache={cache})")
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    versions = {"numpy": np.__version__, "sklearn": sklearn.__version__}
+    try:
+        import xgboost  # pylint: disable=import-outside-toplevel
+
+        versions["xgboost"] = xgboost.__version__
+    except ImportError:
+        pass
+
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def result_key(entry):
+    return (entry["benchmark"], entry["model"], entry["cache"], entry["batch_size"])
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path, "rt", encoding="utf-8") as f_in:
+        baseline = {result_key(entry): entry for entry in json.load(f_in)["results"]}
+
+    regressions = []
+    for entry in results:
+        base_entry = baseline.get(result_key(entry))
+        if base_entry is None:
+            continue
+        ratio = entry["seconds"]["median"] / base_entry["seconds"]["median"]
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{'/'.join(map(str, result_key(entry))):<50} {ratio:8.3f}x {flag}")
+        if flag:
+            regressions.append(entry)
+    return regressions
+
+
+def parse_list(value, cast=str):
+    return [cast(item) for item in value.split(",") if item]
+
+
+def parse_args():
+    args_parser = argparse.ArgumentParser(description="Benchmark the serving path")
+    args_parser.add_argument(
+        "--batch-sizes",
+        dest="batch_sizes",
+        type=lambda value: parse_list(value, int),
+        default=DEFAULT_BATCH_SIZES,
+    )
+    args_parser.add_argument(
+        "--models", type=parse_list, default=DEFAULT_MODELS, help="svm,rf,dt,xgb"
+    )
+    args_parser.add_argument(
+        "--cache",
+        type=lambda value: [item == "on" for item in parse_list(value)],
+        default=[False, True],
+        help="off,on",
+    )
+    args_parser.add_argument("--repeats", type=int, default=5)
+    args_parser.add_argument(
+        "--single-calls", dest="single_calls", type=int, default=1_000
+    )
+    args_parser.add_argument(
+        "--max-lambda-records", dest="max_lambda_records", type=int, default=1_000
+    )
+    args_parser.add_argument("--output", default=None)
+    args_parser.add_argument("--compare", default=None, help="baseline results JSON")
+    args_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.10,
+        help="median time ratio above which a result is a regression",
+    )
+    return args_parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger("utils.model_serving").setLevel(logging.WARNING)
+
+    report = {"meta": metadata(), "results": run_benchmarks(args)}
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"{report['meta']['commit'] or 'local'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "wt", encoding="utf-8") as f_out:
+        json.dump(report, f_out, indent=2)
+    print(f"Benchmark results saved to: {output}")
+
+    if args.compare and compare(report["results"], args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
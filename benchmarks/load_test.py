@@ -0,0 +1,257 @@
+import json
+import time
+import asyncio
+import logging
+import argparse
+import itertools
+from collections import Counter
+
+import httpx
+import numpy as np
+
+from utils.student_schema import kinesis_event, generate_students
+
+TARGET_URLS = {
+    "predict": "http://localhost:9696/predict",
+    "predict_batch": "http://localhost:9696/predict_batch",
+    "lambda": "http://localhost:8080/2015-03-31/functions/function/invocations",
+}
+
+
+def load_payloads(path):
+    with open(path, "rt", encoding="utf-8") as f_in:
+        return [json.loads(line) for line in f_in if line.strip()]
+
+
+def build_bodies(target, students, records_per_request=1):
+    if target == "predict":
+        return list(students)
+
+    chunks = [
+        students[start : start + records_per_request]
+        for start in range(0, len(students), records_per_request)
+    ]
+    if target == "predict_batch":
+        return chunks
+    return [kinesis_event(chunk) for chunk in chunks]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.sent = 0
+
+    def report(self, elapsed):
+        completed = len(self.latencies)
+        failed = sum(self.errors.values())
+        latencies = np.array(self.latencies or [0.0])
+        return {
+            "sent": self.sent,
+            "completed": completed,
+            "errors": dict(self.errors),
+            "error_rate": failed / self.sent if self.sent else 0.0,
+            "elapsed_seconds": elapsed,
+            "throughput_rps": completed / elapsed if elapsed else 0.0,
+            "latency_seconds": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max()),
+            },
+        }
+
+
+async def send(client, url, body, stats, scheduled=None):
+    # Open-loop latency counts from the scheduled send time, so requests
+    # queued behind a slow server are not left out (coordinated omission).
+    start = scheduled if scheduled is not None else time.perf_counter()
+    stats.sent += 1
+    try:
+        response = await client.post(url, json=body)
+    except httpx.HTTPError as e:
+        stats.errors[type(e).__name__] += 1
+        return
+
+    if response.status_code >= 400:
+        stats.errors[f"http_{response.status_code}"] += 1
+        return
+    # The Lambda runtime interface answers 200 with the error in the body.
+    if response.headers.get("content-type", "").startswith("application/json"):
+        payload = response.json()
+        if isinstance(payload, dict) and "errorType" in payload:
+            stats.errors[payload["errorType"]] += 1
+            return
+
+    stats.latencies.append(time.perf_counter() - start)
+
+
+async def closed_loop(client, url, bodies, stats, *, concurrency, duration, requests):
+    counter = itertools.count()
+    start = time.perf_counter()
+
+    async def worker():
+        while True:
+            i = next(counter)
+            if requests and i >= requests:
+                return
+            if time.perf_counter() - start >= duration:
+                return
+            await send(client, url, bodies[i % len(bodies)], stats)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(
+    client, url, bodies, stats, *, rps, duration, requests, max_in_flight
+):
+    interval = 1.0 / rps
+    start = time.perf_counter()
+    in_flight = set()
+
+    for i in itertools.count():
+        offset = i * interval
+        if offset >= duration or (requests and i >= requests):
+            break
+        scheduled = start + offset
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+
+        if len(in_flight) >= max_in_flight:
+            stats.sent += 1
+            stats.errors["dropped"] += 1
+            continue
+        task = asyncio.create_task(
+            send(client, url, bodies[i % len(bodies)], stats, scheduled=scheduled)
+        )
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    await asyncio.gather(*in_flight)
+
+
+async def run_async(
+    url,
+    bodies,
+    *,
+    mode,
+    concurrency,
+    rps,
+    duration,
+    requests,
+    max_in_flight=1000,
+    timeout=10.0,
+    transport=None,
+):
+    # One pooled client: closed loop reuses `concurrency` keep-alive
+    # connections, open loop may need one per in-flight request.
+    limits = httpx.Limits(
+        max_connections=max_in_flight if mode == "open" else concurrency,
+        max_keepalive_connections=concurrency,
+    )
+    stats = LoadStats()
+
+    async with httpx.AsyncClient(
+        limits=limits, timeout=timeout, transport=transport
+    ) as client:
+        start = time.perf_counter()
+        if mode == "open":
+            await open_loop(
+                client,
+                url,
+                bodies,
+                stats,
+                rps=rps,
+                duration=duration,
+                requests=requests,
+                max_in_flight=max_in_flight,
+            )
+        else:
+            await closed_loop(
+                client,
+                url,
+                bodies,
+                stats,
+                concurrency=concurrency,
+                duration=duration,
+                requests=requests,
+            )
+        elapsed = time.perf_counter() - start
+
+    return stats.report(elapsed)
+
+
+def run_load_test(url, bodies, *, mode="closed", **kwargs):
+    """Drive url with the request bodies and return the latency report.
+
+    mode="closed" keeps `concurrency` requests in flight, each sent as soon
+    as the previous one finishes. mode="open" sends at a fixed `rps`
+    whatever the response times, with at most `max_in_flight` outstanding
+    requests. Both stop after `duration` seconds or `requests` requests.
+    """
+    options = {
+        "concurrency": 10,
+        "rps": 100.0,
+        "duration": 30.0,
+        "requests": None,
+        **kwargs,
+    }
+    return asyncio.run(run_async(url, bodies, mode=mode, **options))
+
+
+def parse_args():
+    args_parser = argparse.ArgumentParser(
+        description="Load test the web service or the Lambda container"
+    )
+    args_parser.add_argument("--target", choices=TARGET_URLS, default="predict")
+    args_parser.add_argument("--url", default=None)
+    args_parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    args_parser.add_argument("--concurrency", type=int, default=10)
+    args_parser.add_argument("--rps", type=float, default=100.0)
+    args_parser.add_argument("--duration", type=float, default=30.0)
+    args_parser.add_argument("--requests", type=int, default=None)
+    args_parser.add_argument(
+        "--max-in-flight", dest="max_in_flight", type=int, default=1000
+    )
+    args_parser.add_argument(
+        "--payloads", default=None, help="JSONL file with one student per line"
+    )
+    args_parser.add_argument("--students", type=int, default=1000)
+    args_parser.add_argument(
+        "--records-per-request", dest="records_per_request", type=int, default=1
+    )
+    args_parser.add_argument("--timeout", type=float, default=10.0)
+    args_parser.add_argument("--output", default=None)
+    return args_parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    if args.payloads:
+        students = load_payloads(args.payloads)
+    else:
+        students = generate_students(args.students).to_dict("records")
+    bodies = build_bodies(args.target, students, args.records_per_request)
+
+    report = run_load_test(
+        args.url or TARGET_URLS[args.target],
+        bodies,
+        mode=args.mode,
+        concurrency=args.concurrency,
+        rps=args.rps,
+        duration=args.duration,
+        requests=args.requests,
+        max_in_flight=args.max_in_flight,
+        timeout=args.timeout,
+    )
+    report.update(target=args.target, mode=args.mode)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "wt", encoding="utf-8") as f_out:
+            json.dump(report, f_out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import argparse
+
+from utils.model_serving import export_serving_bundle
+
+TEST_RUN = os.getenv("TEST_RUN", "False") == "True"
+
+if TEST_RUN:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+def main():
+    args_parser = argparse.ArgumentParser(
+        description="Export the model of RUN_ID as a standalone serving bundle"
+    )
+    args_parser.add_argument("--output-dir", dest="output_dir", default=".")
+    args_parser.add_argument(
+        "--model-version", dest="model_version", default=os.getenv("RUN_ID")
+    )
+    args = args_parser.parse_args()
+
+    bundle_path = export_serving_bundle(args.output_dir, args.model_version)
+    print(f"Serving bundle saved to: {bundle_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,9 +18,19 @@ RUN_ID = os.getenv("RUN_ID")
 EXPERIMENT_NAME = os.getenv("EXPERIMENT_NAME")
 
 PREDICTIONS_STREAM_NAME = os.getenv("PREDICTIONS_STREAM_NAME", "student-performance")
+BATCH_RECORDS = os.getenv("BATCH_RECORDS", "False") == "True"
+SERVING_BUNDLE = os.getenv("SERVING_BUNDLE")
+BUFFER_PREDICTIONS = os.getenv("BUFFER_PREDICTIONS", "False") == "True"
+REPORT_BATCH_ITEM_FAILURES = os.getenv("REPORT_BATCH_ITEM_FAILURES", "False") == "True"
 
 model_service = init_model_service_with_kinesis(
-    prediction_stream_name=PREDICTIONS_STREAM_NAME, run_id=RUN_ID, test_run=TEST_RUN
+    prediction_stream_name=PREDICTIONS_STREAM_NAME,
+    run_id=RUN_ID,
+    test_run=TEST_RUN,
+    batch_records=BATCH_RECORDS,
+    bundle_path=SERVING_BUNDLE,
+    buffer_predictions=BUFFER_PREDICTIONS,
+    report_batch_item_failures=REPORT_BATCH_ITEM_FAILURES,
 )
 
 
@@ -0,0 +1,130 @@
+import json
+import time
+import logging
+import argparse
+
+from utils.model_serving import KINESIS_MAX_RECORDS_PER_CALL, create_kinesis_client
+from utils.student_schema import generate_students
+from utils.stream_consumer import (
+    FileStream,
+    StreamConsumer,
+    CheckpointStore,
+    file_readers,
+    kinesis_readers,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    args_parser = argparse.ArgumentParser(
+        description="Run lambda_handler on the records of a local stream"
+    )
+    source = args_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--stream-name", dest="stream_name", help="Kinesis stream")
+    source.add_argument(
+        "--file-stream", dest="file_stream", help="directory of a file-backed stream"
+    )
+    args_parser.add_argument(
+        "--shards", type=int, default=4, help="shards of a new file stream"
+    )
+    args_parser.add_argument(
+        "--produce", type=int, default=0, help="synthetic students to add first"
+    )
+    args_parser.add_argument("--batch-size", dest="batch_size", type=int, default=100)
+    args_parser.add_argument(
+        "--window", type=float, default=1.0, help="seconds to fill a batch"
+    )
+    args_parser.add_argument("--max-retries", dest="max_retries", type=int, default=3)
+    args_parser.add_argument(
+        "--iterator-type",
+        dest="iterator_type",
+        choices=["TRIM_HORIZON", "LATEST"],
+        default="TRIM_HORIZON",
+    )
+    args_parser.add_argument("--checkpoint", default=None, help="checkpoint JSON file")
+    args_parser.add_argument("--duration", type=float, default=None)
+    args_parser.add_argument(
+        "--until-drained",
+        dest="until_drained",
+        action="store_true",
+        help="stop once every shard is read to the end",
+    )
+    args_parser.add_argument(
+        "--report-interval", dest="report_interval", type=float, default=10.0
+    )
+    return args_parser.parse_args()
+
+
+def student_records(n):
+    for student in generate_students(n).to_dict("records"):
+        student_event = {"student": student, "student_id": student["StudentID"]}
+        yield str(student["StudentID"]), json.dumps(student_event)
+
+
+def main():
+    args = parse_args()
+    # Same model service as the Lambda function, configured from the same
+    # environment variables (RUN_ID, SERVING_BUNDLE, TEST_RUN, ...).
+    from lambda_function import model_service  # pylint: disable=import-outside-toplevel
+
+    checkpoints = CheckpointStore(args.checkpoint)
+    if args.file_stream:
+        file_stream = FileStream(args.file_stream, shards=args.shards)
+        if args.produce:
+            file_stream.put_records(student_records(args.produce))
+        readers = file_readers(file_stream, checkpoints)
+    else:
+        kinesis_client = create_kinesis_client()
+        if args.produce:
+            entries = [
+                {"Data": data.encode("utf-8"), "PartitionKey": partition_key}
+                for partition_key, data in student_records(args.produce)
+            ]
+            for start in range(0, len(entries), KINESIS_MAX_RECORDS_PER_CALL):
+                kinesis_client.put_records(
+                    StreamName=args.stream_name,
+                    Records=entries[start : start + KINESIS_MAX_RECORDS_PER_CALL],
+                )
+        readers = kinesis_readers(
+            kinesis_client, args.stream_name, checkpoints, args.iterator_type
+        )
+
+    consumer = StreamConsumer(
+        readers,
+        model_service.lambda_handler,
+        checkpoints,
+        batch_size=args.batch_size,
+        window_seconds=args.window,
+        max_retries=args.max_retries,
+        stop_when_idle=args.until_drained,
+    ).start()
+
+    deadline = None if args.duration is None else time.monotonic() + args.duration
+    try:
+        while consumer.running():
+            timeout = args.report_interval
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+            consumer.join(timeout)
+            if consumer.running():
+                report = consumer.report()
+                logger.info(
+                    "%d records, %.1f records/s, max lag %.0f ms",
+                    report["records"],
+                    report["records_per_second"],
+                    report["max_lag_ms"],
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        consumer.stop()
+        consumer.join()
+
+    print(json.dumps(consumer.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
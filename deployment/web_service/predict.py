@@ -1,8 +1,23 @@
 import os
 
-from flask import Flask, jsonify, request
-
-from utils.model_serving import init_model_service
+from flask import Flask, Response, jsonify, request
+
+from utils.batch_io import (
+    BatchFormatError,
+    BatchTooLargeError,
+    UnsupportedMediaTypeError,
+    student_ids,
+    batch_format,
+    decode_batch,
+    encode_predictions,
+)
+from utils.validation import ValidationError, InvalidJSONError, loads, student_validator
+from utils.model_serving import (
+    init_model_service,
+    create_micro_batcher,
+    create_model_watcher,
+    init_model_service_from_bundle,
+)
 
 TEST_RUN = os.getenv("TEST_RUN", "False") == "True"
 
@@ -19,22 +34,87 @@ if TEST_RUN:
 
 RUN_ID = os.getenv("RUN_ID")
 EXPERIMENT_NAME = os.getenv("EXPERIMENT_NAME")
+SERVING_BUNDLE = os.getenv("SERVING_BUNDLE")
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE") or 10_000)
+
+if SERVING_BUNDLE:
+    model_service = init_model_service_from_bundle(SERVING_BUNDLE, model_version=RUN_ID)
+else:
+    model_service = init_model_service(model_version=RUN_ID, need_scaler=True)
 
-model_service = init_model_service(need_scaler=True)
+micro_batcher = create_micro_batcher(model_service)
+model_watcher = create_model_watcher(model_service)
 
 print("model and scaler downloaded")
 app = Flask(EXPERIMENT_NAME)
 
 
+def invalid_request(error):
+    if isinstance(error, ValidationError):
+        return jsonify({"error": "Invalid student", "details": error.errors}), 422
+    return jsonify({"error": str(error)}), 400
+
+
 @app.route("/predict", methods=["POST"])
 def predict_endpoint():
-    student = request.get_json()
+    try:
+        student = loads(request.get_data())
+        with model_service.pinned() as state:
+            # Validated before any preprocessing, straight into the feature row.
+            features = student_validator(state.plan.feature_columns).validate(student)
+            if micro_batcher is not None:
+                # Scored by the batcher thread with the state the features
+                # were validated against.
+                pred = micro_batcher.predict(features, context=state)
+            else:
+                pred = model_service.predict(features, copy=False)
+    except (InvalidJSONError, ValidationError) as e:
+        return invalid_request(e)
+
+    result = {"GPA": pred, "model_version": state.model_version}
 
-    pred = model_service.predict(student)
+    return jsonify(result)
 
-    result = {"GPA": pred, "model_version": RUN_ID}
 
-    return jsonify(result)
+@app.route("/predict_batch", methods=["POST"])
+def predict_batch_endpoint():
+    try:
+        fmt = batch_format(request.content_type)
+        students = decode_batch(
+            request.get_data(), request.content_type, max_batch_size=MAX_BATCH_SIZE
+        )
+    except UnsupportedMediaTypeError as e:
+        return jsonify({"error": str(e)}), 415
+    except BatchTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    except BatchFormatError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with model_service.pinned() as state:
+        validator = student_validator(state.plan.feature_columns)
+        try:
+            if isinstance(students, list):
+                features = validator.validate_records(students)
+            else:
+                features = validator.validate_frame(students)
+        except ValidationError as e:
+            return invalid_request(e)
+        predictions = (
+            model_service.predict_records(features, copy=False) if len(students) else []
+        )
+
+    body, mimetype = encode_predictions(student_ids(students), predictions, fmt)
+
+    return Response(
+        body, mimetype=mimetype, headers={"X-Model-Version": state.model_version or ""}
+    )
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(
+        model_service.metrics.to_prometheus(), mimetype="text/plain; version=0.0.4"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+import os
+import logging
+import argparse
+
+from utils.prefork import PreforkServer, share_arrays
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args():
+    args_parser = argparse.ArgumentParser(
+        description="Serve the prediction web service with pre-forked workers"
+    )
+    args_parser.add_argument("--host", default=os.getenv("HOST") or "0.0.0.0")
+    args_parser.add_argument("--port", type=int, default=int(os.getenv("PORT") or 9696))
+    args_parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_WORKERS") or 0)
+    )
+    args_parser.add_argument(
+        "--max-requests",
+        dest="max_requests",
+        type=int,
+        default=int(os.getenv("WEB_MAX_REQUESTS") or 0),
+    )
+    args_parser.add_argument(
+        "--max-requests-jitter",
+        dest="max_requests_jitter",
+        type=int,
+        default=int(os.getenv("WEB_MAX_REQUESTS_JITTER") or 0),
+    )
+    args_parser.add_argument(
+        "--threaded",
+        action="store_true",
+        default=os.getenv("WEB_THREADED", "False") == "True",
+    )
+    return args_parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Importing the app loads the model once, in the master process.
+    # pylint: disable=import-outside-toplevel
+    from utils.model_serving import create_micro_batcher, create_model_watcher
+    from deployment.web_service import predict
+
+    model_service = predict.model_service
+    shared_bytes = share_arrays(model_service.model)
+    if model_service.plan is not None:
+        shared_bytes += share_arrays(model_service.plan)
+    logger.info("Moved %d bytes of model arrays to shared memory", shared_bytes)
+
+    def post_fork():
+        # Threads do not survive fork, so each worker starts its own batcher
+        # and model watcher.
+        if predict.micro_batcher is not None:
+            predict.micro_batcher = create_micro_batcher(model_service)
+        if predict.model_watcher is not None:
+            predict.model_watcher = create_model_watcher(model_service)
+
+    PreforkServer(
+        predict.app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers or None,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        threaded=args.threaded or predict.micro_batcher is not None,
+        post_fork=post_fork,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ resource "aws_lambda_function" "kinesis_lambda" {
     variables = {
       PREDICTIONS_STREAM_NAME = var.output_stream_name
       MODEL_BUCKET = var.model_bucket
+      REPORT_BATCH_ITEM_FAILURES = "True"
     }
   }
   timeout = 180
@@ -30,6 +31,10 @@ resource "aws_lambda_event_source_mapping" "kinesis_mapping" {
   event_source_arn  = var.source_stream_arn
   function_name     = aws_lambda_function.kinesis_lambda.arn
   starting_position = "LATEST"
+  // Only the records returned in batchItemFailures are retried, and a poison
+  // record is given up on after a few attempts instead of stalling the shard.
+  function_response_types = ["ReportBatchItemFailures"]
+  maximum_retry_attempts  = var.lambda_event_source_mapping_max_retries
   depends_on = [
     aws_iam_role_policy_attachment.kinesis_processing
   ]
@@ -27,3 +27,8 @@ variable "lambda_function_name" {
 variable "image_uri" {
   description = "ECR image uri"
 }
+
+variable "lambda_event_source_mapping_max_retries" {
+  description = "Retries of the failed records of a Kinesis batch before they are skipped"
+  default     = 3
+}
@@ -51,7 +51,9 @@ def get_predictions(data: pd.DataFrame) -> pd.DataFrame:
     model_service = init_model_service()
     predictions = data[["uuid"]]
     scoring_data = prepare_scoring_data(data)
-    predictions["predictions"] = model_service.only_predict(scoring_data)
+    predictions["predictions"] = model_service.batch_predict(
+        scoring_data, preprocess=False
+    )
 
     return predictions
 
@@ -34,7 +34,9 @@ def prepare_reference_dataset():
     scoring_data = prepare_scoring_data(data)
 
     model_service = init_model_service()
-    predictions_df[prediction_col] = model_service.only_predict(scoring_data)
+    predictions_df[prediction_col] = model_service.batch_predict(
+        scoring_data, preprocess=False
+    )
 
     print("Save reference dataset")
     REFERENCE_DATA_DIR = Path("data/reference")
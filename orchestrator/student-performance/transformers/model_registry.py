@@ -19,8 +19,10 @@ def register_model():
         if experiment.name == experiment_name
     ]
 
+    # Only the top trials of the search have a logged model.
     run = client.search_runs(
         experiment_ids=experiment_id,
+        filter_string="tags.model_logged = 'true'",
         run_view_type=ViewType.ACTIVE_ONLY,
         order_by=["metrics.accuracy DESC"],
     )[0]
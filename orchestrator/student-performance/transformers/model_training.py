@@ -1,68 +1,640 @@
+import os
+import json
+import math
+import time
+import queue
+import pickle
+import hashlib
+import sqlite3
+import tempfile
+import multiprocessing
 from functools import partial
+from contextlib import closing
 
+import numpy as np
 import mlflow
 import pandas as pd
+import xgboost as xgb
 import scipy.stats as stats
 from xgboost import XGBClassifier
 from hyperopt import STATUS_OK, Trials, hp, tpe, fmin, space_eval
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
+from hyperopt.base import (
+    JOB_STATE_NEW,
+    JOB_STATE_DONE,
+    JOB_STATE_ERROR,
+    JOB_STATE_RUNNING,
+    Domain,
+    spec_from_misc,
+)
+from hyperopt.fmin import pickler
+from threadpoolctl import threadpool_limits
+from hyperopt.utils import coarse_utcnow
 from sklearn.metrics import f1_score, roc_auc_score, accuracy_score
 from sklearn.ensemble import RandomForestClassifier
+from hyperopt.exceptions import AllTrialsFailed
 
 if "transformer" not in globals():
     from mage_ai.data_preparation.decorators import transformer
 if "test" not in globals():
     from mage_ai.data_preparation.decorators import test
 
+MAX_EVALS = 32
+# Only the models of the best LOG_TOP_K_MODELS trials are logged to MLflow,
+# once the search ends. 0 logs the model of every trial as it finishes.
+LOG_TOP_K_MODELS = int(os.getenv("LOG_TOP_K_MODELS") or 3)
+CPU_COUNT = os.cpu_count() or 1
+# Trials run in parallel lose some of TPE's adaptivity (each suggestion only
+# sees the trials finished so far), so by default a quarter of the cores run
+# trials and every trial gets 4 threads.
+HYPEROPT_PARALLELISM = int(os.getenv("HYPEROPT_PARALLELISM") or max(1, CPU_COUNT // 4))
+HYPEROPT_THREADS_PER_TRIAL = int(
+    os.getenv("HYPEROPT_THREADS_PER_TRIAL") or max(1, CPU_COUNT // HYPEROPT_PARALLELISM)
+)
+# Seconds a parallel trial may run before its worker is killed and the trial
+# fails, so a hung worker (e.g. a deadlocked BLAS call) cannot stall the search.
+HYPEROPT_TRIAL_TIMEOUT = float(os.getenv("HYPEROPT_TRIAL_TIMEOUT") or 3600)
+# "tpe" fits all MAX_EVALS trials on the full training set. "halving" fits
+# HALVING_CONFIGS trials on a HALVING_MIN_FRACTION subsample and promotes the
+# best 1/HALVING_ETA of every rung to a HALVING_ETA times larger subsample,
+# up to the full training set.
+HYPEROPT_SEARCH = os.getenv("HYPEROPT_SEARCH") or "tpe"
+HALVING_CONFIGS = int(os.getenv("HALVING_CONFIGS") or 10 * MAX_EVALS)
+HALVING_ETA = int(os.getenv("HALVING_ETA") or 3)
+HALVING_MIN_FRACTION = float(os.getenv("HALVING_MIN_FRACTION") or 1 / 27)
+# Completed trials are saved to this SQLite database, and a re-run of the
+# same search on the same data resumes from them. Empty to disable.
+HYPEROPT_TRIALS_DB = os.getenv("HYPEROPT_TRIALS_DB", "hyperopt_trials.db") or None
+
 
 def init_mlflow():
     mlflow.set_tracking_uri("http://mlflow:5000")
     mlflow.set_experiment("student-performance")
 
 
-def objective(params, X_train, X_val, y_train, y_val):
-    with mlflow.start_run(nested=True):
+class TrainingData:
+    """Training and validation splits, converted once for all the trials.
+
+    Features are C-ordered float32 arrays (the dtype the tree models fit on)
+    and targets flat arrays, saved as .npy files and memory mapped read-only.
+    The feature column names are saved with them, and frame() wraps an array
+    back into a DataFrame without copying it, so the models keep their
+    feature names. Instances are pickled by directory, so trial workers map
+    the same files instead of receiving a copy of the data. The XGBoost
+    QuantileDMatrix is built once per process, on first use.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.X_train = self._load("X_train")
+        self.X_val = self._load("X_val")
+        self.y_train = self._load("y_train")
+        self.y_val = self._load("y_val")
+        with open(
+            os.path.join(directory, "columns.json"), "rt", encoding="utf-8"
+        ) as f_in:
+            self.columns = json.load(f_in)
+        self.n_classes = int(np.max(self.y_train)) + 1
+        self._dtrain = None
+
+    @classmethod
+    def save(cls, directory, X_train, X_val, y_train, y_val, columns=None):
+        os.makedirs(directory, exist_ok=True)
+        # Like in sklearn, only string column names are feature names.
+        if columns is None and hasattr(X_train, "columns"):
+            if all(isinstance(column, str) for column in X_train.columns):
+                columns = list(X_train.columns)
+        with open(
+            os.path.join(directory, "columns.json"), "wt", encoding="utf-8"
+        ) as f_out:
+            json.dump(columns, f_out)
+        for name, features in (("X_train", X_train), ("X_val", X_val)):
+            np.save(
+                os.path.join(directory, f"{name}.npy"),
+                np.ascontiguousarray(features, dtype=np.float32),
+            )
+        for name, target in (("y_train", y_train), ("y_val", y_val)):
+            np.save(
+                os.path.join(directory, f"{name}.npy"),
+                np.ascontiguousarray(np.asarray(target).ravel()),
+            )
+        return cls(directory)
+
+    def _load(self, name):
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+    def __reduce__(self):
+        return (self.__class__, (self.directory,))
+
+    def frame(self, features):
+        return pd.DataFrame(features, columns=self.columns, copy=False)
+
+    def dtrain(self):
+        if self._dtrain is None:
+            self._dtrain = xgb.QuantileDMatrix(
+                self.X_train, label=self.y_train, feature_names=self.columns
+            )
+        return self._dtrain
+
+
+def fit_xgb(clf, data):
+    # Trained on the shared QuantileDMatrix instead of letting fit() build one
+    # from the arrays, then loaded back so the sklearn model is logged as
+    # before.
+    params = clf.get_xgb_params()
+    # The objective XGBClassifier.fit picks for the number of classes.
+    if data.n_classes > 2:
+        params.update(objective="multi:softprob", num_class=data.n_classes)
+    else:
+        params["objective"] = "binary:logistic"
+    booster = xgb.train(params, data.dtrain(), num_boost_round=clf.n_estimators or 100)
+    clf.load_model(bytearray(booster.save_raw("json")))
+    return clf
+
+
+def log_model_artifacts(clf):
+    mlflow.sklearn.log_model(sk_model=clf, artifact_path="mlruns")
+    # Serving loads the scaler from the run of the deployed model.
+    mlflow.log_artifact(local_path="minmax_scaler.bin", artifact_path="minmax_scaler")
+    mlflow.set_tag("model_logged", "true")
+
+
+def objective(
+    params,
+    data,
+    n_threads=1,
+    parent_run_id=None,
+    model_dir=None,
+    run_tags=None,
+):
+    # The parent run is given explicitly, as the trial may run in a worker
+    # process that does not share the active run of the search.
+    tags = dict(run_tags or {})
+    if parent_run_id is not None:
+        tags["mlflow.parentRunId"] = parent_run_id
+    with mlflow.start_run(nested=True, tags=tags) as run:
         print(params)
         classifier_type = params["type"]
         mlflow.set_tag("model", classifier_type)
+        mlflow.set_tag("n_threads", n_threads)
         del params["type"]
         if classifier_type == "svm":
             clf = SVC(**params)
         elif classifier_type == "rf":
-            clf = RandomForestClassifier(**params)
+            clf = RandomForestClassifier(**params, n_jobs=n_threads)
         elif classifier_type == "dt":
             clf = DecisionTreeClassifier(**params)
         elif classifier_type == "xgb":
-            clf = XGBClassifier(**params)
+            clf = XGBClassifier(**params, n_jobs=n_threads)
         else:
             return 0
         mlflow.log_params(params)
 
-        clf.fit(X_train, y_train)
+        if classifier_type == "xgb":
+            fit_xgb(clf, data)
+        else:
+            clf.fit(data.frame(data.X_train), data.y_train)
 
+        X_val = data.frame(data.X_val)
         y_pred = clf.predict(X_val)
-        accuracy = accuracy_score(y_val, y_pred)
+        accuracy = accuracy_score(data.y_val, y_pred)
         mlflow.log_metric("accuracy", accuracy)
-        f1 = f1_score(y_val, y_pred, average="macro")
+        f1 = f1_score(data.y_val, y_pred, average="macro")
         mlflow.log_metric("f1_score", f1)
 
         if getattr(clf, "predict_proba", None):
             y_pred_proba = clf.predict_proba(X_val)
             roc_auc = roc_auc_score(
-                y_val, y_pred_proba, average="micro", multi_class="ovr"
+                data.y_val, y_pred_proba, average="micro", multi_class="ovr"
             )
             mlflow.log_metric("roc_auc", roc_auc)
 
-        mlflow.sklearn.log_model(sk_model=clf, artifact_path="mlruns")
-        mlflow.log_artifact(
-            local_path="minmax_scaler.bin", artifact_path="minmax_scaler"
+        if model_dir is None:
+            log_model_artifacts(clf)
+        else:
+            # Spilled to disk, log_top_models logs it if the trial is in the
+            # top k.
+            model_path = os.path.join(model_dir, f"{run.info.run_id}.pkl")
+            with open(model_path, "wb") as f_out:
+                pickle.dump(clf, f_out)
+
+    return {"loss": -f1, "status": STATUS_OK, "run_id": run.info.run_id}
+
+
+def log_top_models(results, model_dir, top_k):
+    results = sorted(
+        (result for result in results if result.get("status") == STATUS_OK),
+        key=lambda result: result["loss"],
+    )
+    for result in results[:top_k]:
+        model_path = os.path.join(model_dir, f"{result['run_id']}.pkl")
+        if not os.path.exists(model_path):
+            # Logged by an earlier run of a resumed search.
+            continue
+        with open(model_path, "rb") as f_in:
+            clf = pickle.load(f_in)
+        with mlflow.start_run(run_id=result["run_id"], nested=True):
+            log_model_artifacts(clf)
+        print(f"Logged the model of run {result['run_id']} (loss {result['loss']})")
+
+    # A resumed search only adds trials, so no other spilled model can reach
+    # the top k any more.
+    for name in os.listdir(model_dir):
+        if name.endswith(".pkl"):
+            os.remove(os.path.join(model_dir, name))
+
+
+def trial_worker(domain_msg, tasks, results, n_threads):
+    # Forked by ProcessPoolTrials, so neither this function nor the objective
+    # have to be importable. BLAS/OpenMP pools are capped to the trial budget.
+    domain = pickler.loads(domain_msg)
+    with threadpool_limits(limits=n_threads):
+        for tid, spec in iter(tasks.get, None):
+            try:
+                result = domain.evaluate(spec, ctrl=None, attach_attachments=False)
+            except Exception as e:
+                results.put((tid, None, (str(type(e)), str(e))))
+            else:
+                results.put((tid, result, None))
+
+
+def evaluate_specs(domain, specs, parallelism, n_threads, timeout=None):
+    # Evaluates given points of the search space, like fmin would for
+    # suggested ones. Failed points get a None result, like the points still
+    # running when no result arrived for timeout seconds.
+    results = [None] * len(specs)
+    if parallelism <= 1:
+        for i, spec in enumerate(specs):
+            try:
+                results[i] = domain.evaluate(spec, ctrl=None, attach_attachments=False)
+            except Exception as e:
+                print(f"Trial {i} failed: {e}")
+        return results
+
+    context = multiprocessing.get_context("fork")
+    tasks = context.SimpleQueue()
+    queued_results = context.Queue()
+    workers = [
+        context.Process(
+            target=trial_worker,
+            args=(pickler.dumps(domain), tasks, queued_results, n_threads),
+            daemon=True,
         )
+        for _ in range(min(parallelism, len(specs)))
+    ]
+    for worker in workers:
+        worker.start()
+    for i, spec in enumerate(specs):
+        tasks.put((i, spec))
+    for _ in workers:
+        tasks.put(None)
+    pending = set(range(len(specs)))
+    while pending:
+        try:
+            i, result, error = queued_results.get(timeout=timeout)
+        except queue.Empty:
+            print(f"Trials {sorted(pending)} timed out after {timeout} seconds")
+            break
+        pending.discard(i)
+        if error is None:
+            results[i] = result
+        else:
+            print(f"Trial {i} failed: {error}")
+    for worker in workers:
+        if pending:
+            worker.kill()
+        worker.join()
+    return results
+
 
-    return {"loss": -f1, "status": STATUS_OK}
+def search_fingerprint(search_space, search, *data):
+    digest = hashlib.sha256(str(search_space).encode("utf-8"))
+    digest.update(search.encode("utf-8"))
+    for values in data:
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
 
 
-def hyperopt_training(X_train, X_val, y_train, y_val):
+class SQLiteTrialStore:
+    """Completed hyperopt trials, saved in a SQLite database.
+
+    Trials are keyed by MLflow experiment and by a fingerprint of the search
+    space and the data, so only a re-run of the same search reads them back.
+    """
+
+    def __init__(self, path, experiment, fingerprint):
+        self.path = path
+        self.key = (experiment, fingerprint)
+        # Spilled models of the search, kept for the trials that are resumed.
+        self.model_dir = f"{os.path.splitext(path)[0]}_models/{fingerprint}"
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS trials ("
+                "experiment TEXT, fingerprint TEXT, tid INTEGER, doc BLOB, "
+                "PRIMARY KEY (experiment, fingerprint, tid))"
+            )
+
+    def load(self):
+        with closing(sqlite3.connect(self.path)) as conn:
+            rows = conn.execute(
+                "SELECT doc FROM trials WHERE experiment = ? AND fingerprint = ? "
+                "ORDER BY tid",
+                self.key,
+            ).fetchall()
+        return [pickle.loads(doc) for (doc,) in rows]
+
+    def save(self, docs, replace=False):
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            if replace:
+                conn.execute(
+                    "DELETE FROM trials WHERE experiment = ? AND fingerprint = ?",
+                    self.key,
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?)",
+                [(*self.key, doc["tid"], pickle.dumps(doc)) for doc in docs],
+            )
+
+
+class StoredTrials(Trials):
+    """Trials saved to a SQLiteTrialStore as soon as they complete.
+
+    The trials of the store are loaded first, so fmin only runs the
+    evaluations that are missing and TPE starts from the earlier results.
+    """
+
+    def __init__(self, store=None, exp_key=None, refresh=True):
+        self.store = store
+        self._saved = set()
+        super().__init__(exp_key=exp_key, refresh=refresh)
+        if store is not None:
+            self.resume()
+
+    def resume(self):
+        docs = self.store.load()
+        if not docs:
+            return
+        # Trials that were running when the search stopped are missing, the
+        # others are renumbered so trial ids stay consecutive.
+        for tid, doc in enumerate(docs):
+            doc["tid"] = doc["misc"]["tid"] = tid
+            doc["misc"]["idxs"] = {
+                label: [tid] * len(idxs) for label, idxs in doc["misc"]["idxs"].items()
+            }
+        self.store.save(docs, replace=True)
+        self._ids.update(range(len(docs)))
+        self._saved.update(range(len(docs)))
+        self.insert_trial_docs(docs)
+        self.refresh()
+        print(f"Resumed {len(docs)} trials from {self.store.path}")
+
+    def refresh(self):
+        super().refresh()
+        if self.store is None:
+            return
+        completed = [
+            trial
+            for trial in self._dynamic_trials
+            if trial["state"] == JOB_STATE_DONE and trial["tid"] not in self._saved
+        ]
+        if completed:
+            self.store.save(completed)
+            self._saved.update(trial["tid"] for trial in completed)
+
+
+class ProcessPoolTrials(StoredTrials):
+    """Trials evaluated by a pool of forked worker processes.
+
+    fmin runs asynchronously with these trials: whenever a worker is free,
+    TPE suggests the next point from all the results finished so far. A trial
+    still running after timeout seconds fails, and its worker is replaced.
+    """
+
+    asynchronous = True
+
+    def __init__(
+        self,
+        parallelism,
+        n_threads=1,
+        store=None,
+        timeout=None,
+        exp_key=None,
+        refresh=True,
+    ):
+        self.parallelism = parallelism
+        self.n_threads = n_threads
+        self.timeout = timeout
+        # One (process, task queue) pair per worker, so the trial of every
+        # worker is known.
+        self._workers = []
+        self._results = None
+        # tid -> (trial, worker index, start time)
+        self._running = {}
+        super().__init__(store=store, exp_key=exp_key, refresh=refresh)
+
+    def start_worker(self):
+        context = multiprocessing.get_context("fork")
+        if self._results is None:
+            self._results = context.Queue()
+        tasks = context.SimpleQueue()
+        worker = context.Process(
+            target=trial_worker,
+            args=(
+                self.attachments["FMinIter_Domain"],
+                tasks,
+                self._results,
+                self.n_threads,
+            ),
+            daemon=True,
+        )
+        worker.start()
+        return worker, tasks
+
+    def collect(self):
+        while self._running:
+            try:
+                tid, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if tid not in self._running:
+                # Timed out already.
+                continue
+            trial, _, _ = self._running.pop(tid)
+            if error is not None:
+                # Like in a serial fmin, an objective that raises ends the
+                # search.
+                raise RuntimeError(f"Trial {tid} failed with {error[0]}: {error[1]}")
+            trial["result"] = result
+            trial["state"] = JOB_STATE_DONE
+            trial["refresh_time"] = coarse_utcnow()
+
+        for tid, (trial, index, started) in list(self._running.items()):
+            if self.timeout is None or time.monotonic() - started < self.timeout:
+                continue
+            worker, _ = self._workers[index]
+            worker.kill()
+            worker.join()
+            self._workers[index] = self.start_worker()
+            del self._running[tid]
+            print(f"Trial {tid} timed out after {self.timeout} seconds")
+            trial["misc"]["error"] = ("TimeoutError", f"{self.timeout} seconds")
+            trial["state"] = JOB_STATE_ERROR
+            trial["refresh_time"] = coarse_utcnow()
+
+        dead = [worker for worker, _ in self._workers if not worker.is_alive()]
+        if dead and self._running:
+            raise RuntimeError(f"Trial worker exited with code {dead[0].exitcode}")
+
+    def dispatch(self):
+        busy = {index for _, index, _ in self._running.values()}
+        for trial in self._dynamic_trials:
+            if len(self._running) >= self.parallelism:
+                break
+            if trial["state"] != JOB_STATE_NEW:
+                continue
+            if not self._workers:
+                self._workers = [self.start_worker() for _ in range(self.parallelism)]
+            index = next(i for i in range(self.parallelism) if i not in busy)
+            busy.add(index)
+            trial["state"] = JOB_STATE_RUNNING
+            trial["book_time"] = coarse_utcnow()
+            self._running[trial["tid"]] = (trial, index, time.monotonic())
+            self._workers[index][1].put((trial["tid"], spec_from_misc(trial["misc"])))
+
+    def refresh(self):
+        if self._workers or "FMinIter_Domain" in self.attachments:
+            self.collect()
+            self.dispatch()
+        super().refresh()
+
+    def close(self):
+        # Workers still running a trial are only left when the search failed.
+        busy = {index for _, index, _ in self._running.values()}
+        for index, (worker, tasks) in enumerate(self._workers):
+            if index in busy:
+                worker.kill()
+            else:
+                tasks.put(None)
+        for worker, _ in self._workers:
+            worker.join()
+        self._workers = []
+        self._running = {}
+
+
+def halving_fractions(min_fraction, eta):
+    n_rungs = max(1, round(math.log(1 / min_fraction, eta)) + 1)
+    return [eta ** (rung - n_rungs + 1) for rung in range(n_rungs)]
+
+
+def subsample(X, y, fraction, seed=0):
+    # Stratified, so every class is in the subsample, and nested: the rows of
+    # a fraction are kept in every larger one.
+    if fraction >= 1:
+        return X, y
+    order = np.random.default_rng(seed).permutation(len(y))
+    rows = np.sort(
+        np.concatenate(
+            [
+                class_rows[: math.ceil(fraction * len(class_rows))]
+                for class_rows in (order[y[order] == label] for label in np.unique(y))
+            ]
+        )
+    )
+    return X[rows], y[rows]
+
+
+def successive_halving(
+    objective_with_data,
+    search_space,
+    data,
+    data_dir,
+    trials,
+    parallelism,
+    n_threads,
+    timeout=None,
+):
+    # The first rung is a TPE search on the smallest subsample, the promoted
+    # points of the later rungs are evaluated as they are. Returns the
+    # (spec, result) pairs of the full fidelity rung, best first.
+    client = mlflow.tracking.MlflowClient()
+    fractions = halving_fractions(HALVING_MIN_FRACTION, HALVING_ETA)
+    specs = None
+    for rung, fraction in enumerate(fractions):
+        X_rung, y_rung = subsample(data.X_train, data.y_train, fraction)
+        print(f"Rung {rung}: {len(y_rung)} training rows")
+        rung_data = TrainingData.save(
+            os.path.join(data_dir, f"rung_{rung}"),
+            X_rung,
+            data.X_val,
+            y_rung,
+            data.y_val,
+            columns=data.columns,
+        )
+        rung_objective = partial(
+            objective_with_data,
+            data=rung_data,
+            run_tags={"rung": rung, "train_fraction": fraction},
+        )
+        if specs is None:
+            try:
+                fmin(
+                    fn=rung_objective,
+                    space=search_space,
+                    algo=tpe.suggest,
+                    max_evals=HALVING_CONFIGS,
+                    trials=trials,
+                )
+            except AllTrialsFailed:
+                # Reported below, like a rung without survivors.
+                pass
+            evaluated = [
+                (spec_from_misc(trial["misc"]), trial["result"])
+                for trial in trials.trials
+                if trial["state"] == JOB_STATE_DONE
+            ]
+        else:
+            domain = Domain(rung_objective, search_space)
+            evaluated = list(
+                zip(
+                    specs,
+                    evaluate_specs(domain, specs, parallelism, n_threads, timeout),
+                )
+            )
+
+        ranked = sorted(
+            (
+                (spec, result)
+                for spec, result in evaluated
+                if result is not None and result.get("status") == STATUS_OK
+            ),
+            key=lambda evaluation: evaluation[1]["loss"],
+        )
+        if not ranked:
+            raise RuntimeError(f"No trial of rung {rung} succeeded, nothing to promote")
+        if rung == len(fractions) - 1:
+            return ranked
+
+        n_promoted = max(1, len(ranked) // HALVING_ETA)
+        # Pruned trials keep their run, tagged to tell them apart.
+        for _, result in ranked[n_promoted:]:
+            client.set_tag(result["run_id"], "pruned", "true")
+        specs = [spec for spec, _ in ranked[:n_promoted]]
+    return []
+
+
+def hyperopt_training(
+    X_train,
+    X_val,
+    y_train,
+    y_val,
+    parallelism=HYPEROPT_PARALLELISM,
+    n_threads=HYPEROPT_THREADS_PER_TRIAL,
+    top_k=LOG_TOP_K_MODELS,
+    search=HYPEROPT_SEARCH,
+    trials_db=HYPEROPT_TRIALS_DB,
+    trial_timeout=HYPEROPT_TRIAL_TIMEOUT,
+):
 
     search_space = hp.choice(
         "classifier_type",
@@ -99,18 +671,84 @@ def hyperopt_training(X_train, X_val, y_train, y_val):
     )
 
     algo = tpe.suggest
-    objective_with_data = partial(
-        objective, X_train=X_train, X_val=X_val, y_train=y_train, y_val=y_val
-    )
 
-    with mlflow.start_run(nested=True):
-        best_result = fmin(
-            fn=objective_with_data,
-            space=search_space,
-            algo=algo,
-            max_evals=32,
-            trials=Trials(),
+    with mlflow.start_run(nested=True) as run, tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, "data")
+        data = TrainingData.save(data_dir, X_train, X_val, y_train, y_val)
+        spill = tmp_dir
+        mlflow.log_artifact(
+            local_path="minmax_scaler.bin", artifact_path="minmax_scaler"
         )
+        store = None
+        if trials_db is not None:
+            # The first rung of a halving search is scored on a subsample,
+            # and promoted along the rungs of HALVING_ETA.
+            search_id = search
+            if search == "halving":
+                fractions = halving_fractions(HALVING_MIN_FRACTION, HALVING_ETA)
+                search_id = f"halving-{HALVING_ETA}-{fractions}"
+            store = SQLiteTrialStore(
+                trials_db,
+                mlflow.get_experiment(run.info.experiment_id).name,
+                search_fingerprint(
+                    search_space,
+                    search_id,
+                    data.X_train,
+                    data.X_val,
+                    data.y_train,
+                    data.y_val,
+                ),
+            )
+            if search != "halving":
+                # Kept until the search ends, for the trials a crashed search
+                # resumes. Halving only resumes its first rung and re-evaluates
+                # the others, so its models stay in the temporary directory.
+                spill = store.model_dir
+                os.makedirs(spill, exist_ok=True)
+        if parallelism <= 1:
+            trials = StoredTrials(store)
+        else:
+            trials = ProcessPoolTrials(
+                parallelism, n_threads, store, timeout=trial_timeout
+            )
+
+        model_dir = spill if top_k > 0 else None
+        objective_with_data = partial(
+            objective,
+            data=data,
+            n_threads=n_threads,
+            parent_run_id=run.info.run_id,
+            model_dir=model_dir,
+        )
+        try:
+            if search == "halving":
+                ranked = successive_halving(
+                    objective_with_data,
+                    search_space,
+                    data,
+                    data_dir,
+                    trials,
+                    parallelism,
+                    n_threads,
+                    trial_timeout,
+                )
+                best_result = ranked[0][0]
+                results = [result for _, result in ranked]
+            else:
+                best_result = fmin(
+                    fn=objective_with_data,
+                    space=search_space,
+                    algo=algo,
+                    max_evals=MAX_EVALS,
+                    trials=trials,
+                )
+                results = trials.results
+        finally:
+            if isinstance(trials, ProcessPoolTrials):
+                trials.close()
+
+        if model_dir is not None:
+            log_top_models(results, model_dir, top_k)
     print(space_eval(search_space, best_result))
 
 
@@ -0,0 +1,60 @@
+import os
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).parents[2]
+sys.path.insert(0, str(project_root))
+
+from utils.artifact_cache import ArtifactCache
+
+
+class DownloadMock:
+    def __init__(self, content):
+        self.content = content
+        self.calls = 0
+
+    def __call__(self, dst_path):
+        self.calls += 1
+        folder = os.path.join(dst_path, "minmax_scaler")
+        os.makedirs(folder)
+        artifact_path = os.path.join(folder, "minmax_scaler.bin")
+        with open(artifact_path, "wb") as f_out:
+            f_out.write(self.content)
+        return artifact_path
+
+
+def test_fetch_downloads_once(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    download = DownloadMock(b"scaler")
+
+    first_path = cache.fetch("1", "run", "minmax_scaler/minmax_scaler.bin", download)
+    second_path = ArtifactCache(str(tmp_path)).fetch(
+        "1", "run", "minmax_scaler/minmax_scaler.bin", download
+    )
+
+    assert first_path == second_path
+    assert download.calls == 1
+    assert Path(second_path).read_bytes() == b"scaler"
+
+
+def test_fetch_discards_corrupted_entry(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    download = DownloadMock(b"scaler")
+
+    local_path = cache.fetch("1", "run", "minmax_scaler/minmax_scaler.bin", download)
+    Path(local_path).write_bytes(b"corrupted")
+    local_path = cache.fetch("1", "run", "minmax_scaler/minmax_scaler.bin", download)
+
+    assert download.calls == 2
+    assert Path(local_path).read_bytes() == b"scaler"
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=15)
+
+    first_path = cache.fetch("1", "run_1", "scaler", DownloadMock(b"0123456789"))
+    os.utime(Path(first_path).parents[2] / "manifest.json", (0, 0))
+    second_path = cache.fetch("1", "run_2", "scaler", DownloadMock(b"0123456789"))
+
+    assert not os.path.exists(first_path)
+    assert os.path.exists(second_path)
@@ -0,0 +1,73 @@
+import sys
+import json
+import itertools
+from pathlib import Path
+
+import httpx
+
+project_root = Path(__file__).parents[2]
+sys.path.insert(0, str(project_root))
+
+from benchmarks.load_test import build_bodies, run_load_test
+from utils.student_schema import generate_students
+
+
+def failing_every(n):
+    counter = itertools.count(1)
+
+    def handler(request):
+        if next(counter) % n == 0:
+            return httpx.Response(500)
+        return httpx.Response(
+            200, json={"GPA": 1.0, "student": json.loads(request.content)}
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def test_build_bodies_for_each_target():
+    students = generate_students(5).to_dict("records")
+
+    assert build_bodies("predict", students) == students
+    assert [len(body) for body in build_bodies("predict_batch", students, 2)] == [
+        2,
+        2,
+        1,
+    ]
+    events = build_bodies("lambda", students, 5)
+    assert len(events) == 1 and len(events[0]["Records"]) == 5
+
+
+def test_closed_loop_reports_latency_and_errors():
+    bodies = generate_students(10).to_dict("records")
+
+    report = run_load_test(
+        "http://test/predict",
+        bodies,
+        mode="closed",
+        concurrency=4,
+        requests=20,
+        transport=failing_every(5),
+    )
+
+    assert report["sent"] == 20
+    assert report["completed"] == 16
+    assert report["errors"] == {"http_500": 4}
+    assert report["error_rate"] == 0.2
+    assert 0 < report["latency_seconds"]["p50"] <= report["latency_seconds"]["p99"]
+
+
+def test_open_loop_sends_at_fixed_rate():
+    bodies = generate_students(10).to_dict("records")
+
+    report = run_load_test(
+        "http://test/predict",
+        bodies,
+        mode="open",
+        rps=200,
+        duration=0.1,
+        transport=failing_every(1000),
+    )
+
+    assert report["sent"] == 20
+    assert report["completed"] == 20
@@ -1,13 +1,30 @@
 import sys
+import json
+import logging
+import binascii
+import threading
+import subprocess
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pytest
+import pyarrow as pa
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.preprocessing import MinMaxScaler
 
 project_root = Path(__file__).parents[2]
 sys.path.insert(0, str(project_root))
 
-from utils import model_serving
+from utils import batch_io, model_serving, preprocessing, student_schema
+from utils.metrics import StageMetrics
+from utils.validation import ValidationError, InvalidJSONError, loads, student_validator
+from utils.micro_batcher import MicroBatcher
+from utils.serving_bundle import bundle_filename, write_serving_bundle
+from utils.student_schema import kinesis_event
+from utils.payload_logging import PayloadLogger
+from utils.prediction_cache import PredictionCache
+from utils.callback_dispatcher import CallbackDispatcher
 
 
 def read_text(file):
@@ -162,3 +179,626 @@ def test_lambda_handler():
     }
 
     assert actual_predictions == expected_predictions
+
+
+class SumModelMock:
+    def predict(self, X):
+        return np.asarray(X).sum(axis=1)
+
+
+def fitted_scaler():
+    scaler = MinMaxScaler()
+    scaler.fit(
+        pd.DataFrame(
+            {
+                "ParentalEducation": [0.0, 4.0],
+                "StudyTimeWeekly": [0.0, 20.0],
+                "Absences": [0.0, 29.0],
+                "ParentalSupport": [0.0, 4.0],
+            }
+        )
+    )
+    return scaler
+
+
+def make_students(n):
+    rng = np.random.default_rng(42)
+    return [
+        {
+            "StudentID": float(1001 + i),
+            "Age": float(rng.integers(15, 19)),
+            "Gender": float(rng.integers(0, 2)),
+            "Ethnicity": float(rng.integers(0, 4)),
+            "ParentalEducation": float(rng.integers(0, 5)),
+            "StudyTimeWeekly": float(rng.uniform(0, 20)),
+            "Absences": float(rng.integers(0, 30)),
+            "Tutoring": float(rng.integers(0, 2)),
+            "ParentalSupport": float(rng.integers(0, 5)),
+            "Extracurricular": float(rng.integers(0, 2)),
+            "Sports": float(rng.integers(0, 2)),
+            "Music": float(rng.integers(0, 2)),
+            "Volunteering": float(rng.integers(0, 2)),
+        }
+        for i in range(n)
+    ]
+
+
+def test_batch_lambda_handler_matches_per_record():
+    event = kinesis_event(make_students(25))
+
+    per_record_service = model_serving.ModelService(
+        SumModelMock(), fitted_scaler(), "Test123"
+    )
+    batch_events = []
+    batch_service = model_serving.ModelService(
+        SumModelMock(),
+        fitted_scaler(),
+        "Test123",
+        callbacks=[batch_events.append],
+        batch_records=True,
+    )
+
+    expected_predictions = per_record_service.lambda_handler(event)
+    actual_predictions = batch_service.lambda_handler(event)
+
+    assert actual_predictions == expected_predictions
+    assert batch_events == expected_predictions["predictions"]
+
+
+def test_preprocessing_plan_matches_scaler():
+    students = make_students(10)
+    df_students = pd.DataFrame(students)
+    scaler = fitted_scaler()
+    model_service = model_serving.ModelService(None, scaler)
+
+    expected_features = df_students.copy()
+    expected_features[preprocessing.MINMAX_COLUMNS] = scaler.transform(
+        df_students[preprocessing.MINMAX_COLUMNS]
+    )
+    expected_features = expected_features[preprocessing.FEATURE_COLUMNS].to_numpy()
+
+    from_frame = model_service.preprocess_array(df_students)
+    from_records = model_service.preprocess_array(students)
+    from_record = model_service.preprocess_array(students[0])
+
+    assert from_frame.flags.c_contiguous
+    np.testing.assert_array_equal(from_frame, expected_features)
+    np.testing.assert_array_equal(from_records, expected_features)
+    np.testing.assert_array_equal(from_record, expected_features[:1])
+
+
+def test_batch_predict_returns_aligned_vector():
+    students = pd.DataFrame(make_students(25), index=range(100, 125))
+    model_service = model_serving.ModelService(SumModelMock(), fitted_scaler())
+
+    expected_predictions = np.array(model_service.predict_records(students))
+    actual_predictions = model_service.batch_predict(students, chunk_size=7)
+
+    np.testing.assert_array_equal(actual_predictions, expected_predictions)
+
+    chunks = list(model_service.iter_batch_predict(students, chunk_size=10))
+    assert [len(chunk_pred) for _, chunk_pred in chunks] == [10, 10, 5]
+    assert list(chunks[-1][0]) == list(range(120, 125))
+
+
+class CountingModelMock(SumModelMock):
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, X):
+        self.rows += len(X)
+        return super().predict(X)
+
+
+def test_prediction_cache_hits_and_invalidation():
+    student = make_students(1)[0]
+    model = CountingModelMock()
+    cache = PredictionCache(maxsize=2)
+    model_service = model_serving.ModelService(
+        model, fitted_scaler(), "v1", cache=cache
+    )
+
+    first = model_service.predict(student)
+    second = model_service.predict(student)
+    assert first == second
+    assert model.rows == 1
+    assert cache.stats()["hits"] == 1
+
+    model_service.model_version = "v2"
+    model_service.predict(student)
+    assert model.rows == 2
+    assert len(cache) == 1
+
+    model_service.predict_records(make_students(3))
+    assert len(cache) == 2
+
+
+def test_prediction_cache_ttl():
+    now = [0.0]
+    cache = PredictionCache(maxsize=10, ttl=5, clock=lambda: now[0])
+    key = cache.key(np.array([1.0, 2.0]), "v1")
+
+    cache.put(key, 3.0)
+    assert cache.get(key) == 3.0
+
+    now[0] = 5.0
+    assert cache.get(key) is None
+    assert cache.stats()["misses"] == 1
+
+
+def fitted_tree(scaler, n=200):
+    model_service = model_serving.ModelService(None, scaler)
+    students = make_students(n)
+    features = model_service.preprocessing(pd.DataFrame(students))
+    target = np.round(features.sum(axis=1)) % 5
+    return DecisionTreeClassifier(random_state=0).fit(features, target), students
+
+
+def test_serving_bundle_roundtrip(tmp_path):
+    scaler = fitted_scaler()
+    model, students = fitted_tree(scaler)
+    model_service = model_serving.ModelService(model, scaler, "Test123")
+
+    bundle_path = write_serving_bundle(
+        str(tmp_path / bundle_filename("Test123")), model, model_service.plan, "Test123"
+    )
+    bundle_service = model_serving.init_model_service_from_bundle(bundle_path)
+
+    assert bundle_service.model_version == "Test123"
+    assert bundle_service.predict_records(students) == model_service.predict_records(
+        students
+    )
+
+
+def test_serving_bundle_skips_mlflow_and_boto3(tmp_path):
+    scaler = fitted_scaler()
+    model, _ = fitted_tree(scaler)
+    bundle_path = write_serving_bundle(
+        str(tmp_path / bundle_filename("Test123")),
+        model,
+        model_serving.ModelService(None, scaler).plan,
+    )
+
+    script = (
+        "import sys\n"
+        "from utils import model_serving\n"
+        f"model_serving.init_model_service_from_bundle({bundle_path!r})\n"
+        "assert 'mlflow' not in sys.modules and 'boto3' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=project_root, check=True)
+
+
+def test_compiled_model_service_matches_original(monkeypatch):
+    monkeypatch.setenv("COMPILE_TREES", "True")
+    scaler = fitted_scaler()
+    model, students = fitted_tree(scaler)
+    model_service = model_serving.ModelService(model, scaler)
+    compiled_service = model_serving.ModelService(
+        model_serving.compile_model_if_enabled(model), scaler
+    )
+
+    assert compiled_service.model.accepts_array
+    assert compiled_service.predict_records(students) == model_service.predict_records(
+        students
+    )
+    assert compiled_service.predict(students[0]) == model_service.predict(students[0])
+
+
+class KinesisClientMock:
+    def __init__(self, failures=None):
+        self.failures = list(failures or [])
+        self.calls = []
+
+    def put_records(self, StreamName, Records):
+        self.calls.append((StreamName, list(Records)))
+        n_failed = self.failures.pop(0) if self.failures else 0
+        return {
+            "FailedRecordCount": n_failed,
+            "Records": [
+                (
+                    {"ErrorCode": "ProvisionedThroughputExceededException"}
+                    if i < n_failed
+                    else {"SequenceNumber": str(i), "ShardId": "shardId-000000000000"}
+                )
+                for i in range(len(Records))
+            ],
+        }
+
+
+def test_buffered_kinesis_callback_chunks_and_retries():
+    kinesis_client = KinesisClientMock(failures=[0, 0, 3, 1])
+    callback = model_serving.BufferedKinesisCallback(
+        kinesis_client, "predictions", max_retries=1, sleep=lambda _: None
+    )
+    model_service = model_serving.ModelService(None, None, "Test123")
+
+    for student_id in range(1200):
+        callback(model_service.prediction_event(4.0, float(student_id)))
+    assert not kinesis_client.calls
+
+    result = callback.flush()
+
+    assert [len(records) for _, records in kinesis_client.calls] == [500, 500, 200, 3]
+    assert result == {"delivered": 1199, "dropped": 1, "retried": 3}
+    assert callback.flush() == {"delivered": 0, "dropped": 0, "retried": 0}
+
+
+def test_lambda_handler_flushes_buffered_callbacks():
+    kinesis_client = KinesisClientMock()
+    callback = model_serving.BufferedKinesisCallback(kinesis_client, "predictions")
+    model_service = model_serving.ModelService(
+        SumModelMock(), fitted_scaler(), "Test123", callbacks=[callback]
+    )
+
+    model_service.lambda_handler(kinesis_event(make_students(3)))
+
+    assert len(kinesis_client.calls) == 1
+    assert callback.stats["delivered"] == 3
+
+
+class RecordingSink:
+    def __init__(self):
+        self.events = []
+        self.threads = set()
+
+    def __call__(self, prediction_event):
+        self.threads.add(threading.current_thread())
+        self.events.append(prediction_event)
+
+
+def failing_sink(_):
+    raise RuntimeError("sink down")
+
+
+def test_callback_dispatcher_runs_callbacks_off_thread():
+    sink = RecordingSink()
+    dispatcher = CallbackDispatcher([sink, failing_sink], workers=2)
+    model_service = model_serving.ModelService(
+        SumModelMock(), fitted_scaler(), "Test123", callbacks=[dispatcher]
+    )
+
+    predictions = model_service.lambda_handler(kinesis_event(make_students(3)))
+
+    def student_id(event):
+        return event["prediction"]["student_id"]
+
+    assert sorted(sink.events, key=student_id) == predictions["predictions"]
+    assert threading.current_thread() not in sink.threads
+    stats = dispatcher.stats()["callbacks"]
+    assert stats["RecordingSink"]["calls"] == 3
+    assert stats["failing_sink"]["errors"] == 3
+    dispatcher.close()
+
+
+def test_callback_dispatcher_drop_policy():
+    release = threading.Event()
+    dispatcher = CallbackDispatcher(
+        [lambda _: release.wait(1)], max_queue_size=1, workers=1, policy="drop_newest"
+    )
+
+    for i in range(5):
+        dispatcher({"prediction": i})
+    release.set()
+    dispatcher.flush()
+
+    assert dispatcher.dropped >= 3
+    dispatcher.close()
+
+
+def arrow_stream(rows):
+    table = pa.Table.from_pylist(rows)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def read_batch_response(response, fmt):
+    if fmt == "arrow":
+        return pa.ipc.open_stream(response).read_all().to_pylist()
+    if fmt == "ndjson":
+        return [json.loads(line) for line in response.splitlines()]
+    return json.loads(response)
+
+
+def test_batch_io_formats_roundtrip():
+    students = make_students(5)
+    model_service = model_serving.ModelService(SumModelMock(), fitted_scaler())
+    expected = model_service.predict_records(students)
+
+    bodies = {
+        batch_io.JSON_CONTENT_TYPE: json.dumps(students).encode("utf-8"),
+        batch_io.NDJSON_CONTENT_TYPE: "\n".join(map(json.dumps, students)).encode(),
+        batch_io.ARROW_CONTENT_TYPE: arrow_stream(students),
+    }
+
+    for content_type, body in bodies.items():
+        fmt = batch_io.batch_format(content_type)
+        batch = batch_io.decode_batch(body, content_type, max_batch_size=5)
+        response, mimetype = batch_io.encode_predictions(
+            batch_io.student_ids(batch), model_service.predict_records(batch), fmt
+        )
+        rows = read_batch_response(response, fmt)
+
+        assert mimetype == content_type
+        assert [row["StudentID"] for row in rows] == [s["StudentID"] for s in students]
+        assert [row["GPA"] for row in rows] == expected
+
+
+def test_batch_io_rejects_invalid_batches():
+    body = json.dumps(make_students(3)).encode("utf-8")
+
+    with pytest.raises(batch_io.BatchTooLargeError):
+        batch_io.decode_json(body, max_batch_size=2)
+    with pytest.raises(batch_io.BatchFormatError):
+        batch_io.decode_json(b"{}")
+    with pytest.raises(batch_io.BatchFormatError):
+        batch_io.decode_ndjson(b"[1]\n")
+    with pytest.raises(batch_io.UnsupportedMediaTypeError):
+        batch_io.batch_format("text/csv")
+
+
+class BatchCountingModelMock(SumModelMock):
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        return super().predict(X)
+
+
+def test_micro_batcher_scores_concurrent_requests_together():
+    students = make_students(32)
+    model = BatchCountingModelMock()
+    model_service = model_serving.ModelService(model, fitted_scaler())
+    expected = model_service.predict_records(students)
+    model.calls = 0
+
+    batcher = MicroBatcher(
+        model_service.predict_records, max_batch_size=8, max_wait_seconds=0.05
+    )
+    futures = [batcher.submit(student) for student in students]
+    predictions = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    assert predictions == expected
+    assert model.calls == 4
+    assert batcher.stats()["mean_batch_size"] == 8
+
+
+def test_micro_batcher_scores_records_with_their_pinned_state():
+    students = make_students(4)
+    model_service = model_serving.ModelService(ModelMock(1.0), fitted_scaler(), "v1")
+    batcher = MicroBatcher(model_service.predict_records, max_wait_seconds=0.05)
+
+    with model_service.pinned() as state:
+        # A hot reload lands after validation, before the batch is scored.
+        model_service.swap(ModelMock(2.0), fitted_scaler(), "v2")
+        pinned_futures = [batcher.submit(s, context=state) for s in students[:2]]
+    live_futures = [batcher.submit(student) for student in students[2:]]
+    pinned = [future.result(timeout=5) for future in pinned_futures]
+    live = [future.result(timeout=5) for future in live_futures]
+    batcher.close()
+
+    assert state.model_version == "v1"
+    assert pinned == [1.0, 1.0]
+    assert live == [2.0, 2.0]
+
+
+def test_micro_batcher_propagates_errors():
+    def failing_predict(records):
+        raise ValueError(f"cannot score {len(records)} records")
+
+    batcher = MicroBatcher(failing_predict, max_wait_seconds=0)
+    with pytest.raises(ValueError):
+        batcher.predict(make_students(1)[0], timeout=5)
+    batcher.close()
+
+
+def test_model_watcher_swaps_and_skips_failed_versions(tmp_path):
+    scaler = fitted_scaler()
+    plan = model_serving.ModelService(None, scaler).plan
+    students = make_students(5)
+    model_service = model_serving.ModelService(ModelMock(1.0), scaler, "v1")
+
+    new_model, _ = fitted_tree(scaler)
+    bundle_path = write_serving_bundle(
+        str(tmp_path / bundle_filename("v2")), new_model, plan, "v2"
+    )
+    pointer = tmp_path / "production.json"
+    watcher = model_serving.ModelWatcher(
+        model_service, model_serving.file_source(str(pointer))
+    )
+
+    assert not watcher.poll()
+
+    pointer.write_text(json.dumps({"model_version": "v3", "bundle_path": "missing"}))
+    assert not watcher.poll()
+    assert model_service.model_version == "v1"
+
+    pointer.write_text(json.dumps({"model_version": "v2", "bundle_path": bundle_path}))
+    with model_service.pinned() as state:
+        assert watcher.poll()
+        assert model_service.model_version == state.model_version == "v1"
+
+    assert model_service.model_version == "v2"
+    expected = model_serving.ModelService(new_model, scaler).predict_records(students)
+    assert model_service.predict_records(students) == expected
+
+    assert watcher.rollback()
+    assert model_service.model_version == "v1"
+    assert model_service.predict_records(students) == [1.0] * 5
+
+
+def test_stage_metrics_cover_lambda_handler(caplog):
+    metrics = StageMetrics()
+    model_service = model_serving.ModelService(
+        SumModelMock(),
+        fitted_scaler(),
+        "v1",
+        callbacks=[RecordingSink()],
+        metrics=metrics,
+    )
+
+    model_service.lambda_handler(kinesis_event(make_students(3)))
+    model_service.predict_records(make_students(2))
+
+    summary_log = next(
+        json.loads(record.getMessage())["serving_metrics"]
+        for record in caplog.records
+        if "serving_metrics" in record.getMessage()
+    )
+    stages = summary_log["stages"]
+    for stage in ["base64_decode", "json_parse", "preprocess", "predict", "callbacks"]:
+        assert stages[stage]["count"] == 3
+    assert stages["lambda_handler"]["count"] == 1
+    assert summary_log["counters"] == {"records": 3}
+
+    # The Lambda summary resets the metrics, only predict_records is left.
+    assert set(metrics.summary()["stages"]) == {"preprocess", "predict"}
+    prometheus = metrics.to_prometheus()
+    assert 'stage_duration_seconds_count{stage="predict"} 1' in prometheus
+    assert 'stage_duration_seconds_bucket{stage="predict",le="+Inf"} 1' in prometheus
+
+
+class ReprCounter:
+    def __init__(self):
+        self.calls = 0
+
+    def __repr__(self):
+        self.calls += 1
+        return "x" * 50
+
+
+def test_payload_logger_samples_truncates_and_formats_lazily(caplog):
+    test_logger = logging.getLogger("payload-test")
+    draws = iter([0.9, 0.1, 0.1])
+    payload_logger = PayloadLogger(
+        test_logger, sample_rate=0.5, max_chars=10, rng=lambda: next(draws)
+    )
+    payload = ReprCounter()
+
+    with caplog.at_level(logging.WARNING, logger="payload-test"):
+        payload_logger.log("Raw data", payload)
+        payload_logger.log("Raw data", payload)
+    assert payload.calls == 0
+
+    with caplog.at_level(logging.INFO, logger="payload-test"):
+        payload_logger.log("Raw data", payload)
+    assert caplog.messages == ["Raw data: xxxxxxxxxx... (50 chars)"]
+    assert payload.calls == 1
+
+    assert not PayloadLogger(test_logger).sampled()
+
+
+def test_generate_students_follows_schema():
+    students = student_schema.generate_students(500, seed=3)
+
+    assert list(students.columns) == student_schema.STUDENT_FIELDS
+    assert len(student_schema.STUDENT_FIELDS) == 13
+    for field, (_, low, high) in student_schema.STUDENT_SCHEMA.items():
+        if field != "StudentID":
+            assert students[field].between(low, high).all()
+    assert students["StudentID"].is_unique
+    pd.testing.assert_frame_equal(
+        students, student_schema.generate_students(500, seed=3)
+    )
+
+    model_service = model_serving.ModelService(SumModelMock(), fitted_scaler())
+    assert len(model_service.batch_predict(students)) == 500
+
+
+def test_lambda_handler_reports_batch_item_failures(caplog):
+    students = make_students(4)
+    students[2]["StudyTimeWeekly"] = "not a number"
+    event = kinesis_event(students)
+    event["Records"].insert(1, {"kinesis": {"data": "not base64 json"}})
+    for i, record in enumerate(event["Records"]):
+        record["kinesis"]["sequenceNumber"] = str(100 + i)
+
+    for batch_records in (False, True):
+        caplog.clear()
+        model_service = model_serving.ModelService(
+            SumModelMock(),
+            fitted_scaler(),
+            "v1",
+            batch_records=batch_records,
+            metrics=StageMetrics(),
+            report_batch_item_failures=True,
+        )
+
+        result = model_service.lambda_handler(event)
+
+        assert sorted(
+            failure["itemIdentifier"] for failure in result["batchItemFailures"]
+        ) == ["101", "103"]
+        assert [
+            prediction_event["prediction"]["student_id"]
+            for prediction_event in result["predictions"]
+        ] == [1001.0, 1002.0, 1004.0]
+        summary_log = next(
+            json.loads(record.getMessage())["serving_metrics"]
+            for record in caplog.records
+            if "serving_metrics" in record.getMessage()
+        )
+        assert summary_log["counters"] == {"records": 5, "failed_records": 2}
+
+    # Without the flag, the first failure fails the whole batch.
+    for batch_records in (False, True):
+        model_service = model_serving.ModelService(
+            SumModelMock(), fitted_scaler(), batch_records=batch_records
+        )
+        with pytest.raises(binascii.Error, match="Invalid base64"):
+            model_service.lambda_handler(event)
+        with pytest.raises(ValueError, match="could not convert"):
+            model_service.lambda_handler(kinesis_event(students))
+
+
+def test_predict_records_leaves_feature_arrays_unchanged():
+    students = make_students(3)
+    model_service = model_serving.ModelService(SumModelMock(), fitted_scaler())
+    features = student_validator().validate_records(students)
+    original = features.copy()
+
+    first = model_service.predict_records(features)
+    second = model_service.predict_records(features)
+
+    assert np.array_equal(features, original)
+    assert first == second == model_service.predict_records(students)
+    # The validator path hands over its array, which is scaled in place.
+    assert model_service.predict_records(features, copy=False) == first
+    assert not np.array_equal(features, original)
+
+
+def test_student_validator_coerces_and_rejects():
+    students = make_students(3)
+    validator = student_validator()
+    model_service = model_serving.ModelService(SumModelMock(), fitted_scaler())
+
+    features = validator.validate_records(students)
+    assert np.array_equal(features, model_service.plan.to_array(students))
+    assert model_service.predict(validator.validate(students[0])) == (
+        model_service.predict(students[0])
+    )
+    assert np.array_equal(validator.validate_frame(pd.DataFrame(students)), features)
+    assert loads(b'{"Age": 17}') == {"Age": 17}
+    with pytest.raises(InvalidJSONError):
+        loads(b'{"Age": ')
+
+    invalid = dict(students[0], Absences=-1, Tutoring=True, Music="1")
+    del invalid["Sports"]
+    with pytest.raises(ValidationError) as error:
+        validator.validate(invalid)
+    assert {(e["field"], e["error"]) for e in error.value.errors} == {
+        ("Absences", "must be between 0 and 29"),
+        ("Tutoring", "must be a number"),
+        ("Music", "must be a number"),
+        ("Sports", "is required"),
+    }
+
+    with pytest.raises(ValidationError) as error:
+        validator.validate_records([students[0], {**students[1], "Age": 40}, []])
+    assert [(e["record"], e["field"]) for e in error.value.errors] == [
+        (1, "Age"),
+        (2, None),
+    ]
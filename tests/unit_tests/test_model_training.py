@@ -0,0 +1,282 @@
+import os
+import sys
+import pickle
+import warnings
+import threading
+from pathlib import Path
+
+import numpy as np
+import mlflow
+import pandas as pd
+import pytest
+from hyperopt import STATUS_OK, hp
+from hyperopt.base import Domain
+from sklearn.preprocessing import MinMaxScaler
+
+project_root = Path(__file__).parents[2]
+sys.path.insert(0, str(project_root))
+
+from utils.preprocessing import MINMAX_COLUMNS, FEATURE_COLUMNS
+from utils.student_schema import grade_class, generate_students
+
+TRAINING_BLOCK = (
+    project_root / "orchestrator" / "student-performance" / "transformers"
+) / "model_training.py"
+
+
+def load_training_block():
+    # Mage executes the block instead of importing it.
+    namespace = {
+        "__name__": "model_training",
+        "transformer": lambda function: function,
+        "test": lambda function: function,
+    }
+    code = compile(TRAINING_BLOCK.read_text(encoding="utf-8"), TRAINING_BLOCK, "exec")
+    exec(code, namespace)  # pylint: disable=exec-used
+    return namespace
+
+
+def training_splits(n_train=300, n_val=100):
+    students = generate_students(n_train + n_val, seed=0)
+    target = pd.DataFrame({"GradeClass": grade_class(students).astype(float)})
+    features = students[FEATURE_COLUMNS]
+    return (
+        features.iloc[:n_train],
+        features.iloc[n_train:],
+        target.iloc[:n_train],
+        target.iloc[n_train:],
+    )
+
+
+@pytest.fixture(name="training_block")
+def training_block_fixture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("MLFLOW_ALLOW_FILE_STORE", "true")
+    students = generate_students(10, seed=0)
+    with open("minmax_scaler.bin", "wb") as f_out:
+        pickle.dump(MinMaxScaler().fit(students[MINMAX_COLUMNS]), f_out)
+
+    tracking_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri((tmp_path / "mlruns").as_uri())
+    mlflow.set_experiment("student-performance")
+
+    block = load_training_block()
+    block["logged_models"] = []
+
+    def log_model_artifacts(clf):
+        block["logged_models"].append(clf)
+        mlflow.set_tag("model_logged", "true")
+
+    block["log_model_artifacts"] = log_model_artifacts
+    yield block
+    mlflow.set_tracking_uri(tracking_uri)
+
+
+def test_successive_halving_fails_clearly_without_survivors(training_block):
+    def failing_objective(*_, **__):
+        return {"status": "fail"}
+
+    training_block["objective"] = failing_objective
+    training_block["HALVING_CONFIGS"] = 3
+
+    with pytest.raises(RuntimeError, match="No trial of rung 0 succeeded"):
+        with mlflow.start_run():
+            training_block["hyperopt_training"](
+                *training_splits(), parallelism=1, search="halving", trials_db=None
+            )
+
+
+def test_process_pool_runs_every_trial_under_the_search_run(
+    training_block, monkeypatch
+):
+    monkeypatch.setenv("HYPEROPT_FMIN_SEED", "0")
+    training_block["MAX_EVALS"] = 6
+
+    with mlflow.start_run() as run:
+        training_block["hyperopt_training"](
+            *training_splits(), parallelism=2, n_threads=3, top_k=6, trials_db=None
+        )
+
+    runs = mlflow.search_runs()
+    trial_runs = runs[runs["tags.model"].notna()]
+    (search_run_id,) = runs.loc[
+        runs["tags.mlflow.parentRunId"] == run.info.run_id, "run_id"
+    ]
+    assert len(trial_runs) == 6
+    assert (trial_runs["status"] == "FINISHED").all()
+    assert (trial_runs["tags.mlflow.parentRunId"] == search_run_id).all()
+    assert (trial_runs["tags.n_threads"] == "3").all()
+
+    # The models were fitted in the workers, with the per-trial thread budget.
+    threaded = [
+        clf for clf in training_block["logged_models"] if hasattr(clf, "n_jobs")
+    ]
+    assert threaded
+    assert all(clf.n_jobs == 3 for clf in threaded)
+
+
+def raising_objective(*_, **__):
+    raise ValueError("objective failed")
+
+
+def exiting_objective(*_, **__):
+    os._exit(3)  # pylint: disable=protected-access
+
+
+@pytest.mark.parametrize(
+    "failing_objective, match",
+    [
+        (raising_objective, r"Trial \d+ failed with .*ValueError.*: objective failed"),
+        (exiting_objective, "Trial worker exited with code 3"),
+    ],
+)
+def test_process_pool_search_fails_cleanly(training_block, failing_objective, match):
+    training_block["objective"] = failing_objective
+    training_block["MAX_EVALS"] = 4
+
+    with pytest.raises(RuntimeError, match=match), mlflow.start_run():
+        training_block["hyperopt_training"](
+            *training_splits(), parallelism=2, trials_db=None
+        )
+
+
+def test_process_pool_fails_trials_of_hung_workers(training_block, capsys):
+    objective = training_block["objective"]
+
+    def hanging_objective(*args, **kwargs):
+        try:
+            # Only the first trial hangs, in whichever worker runs it.
+            os.mkdir("hung")
+        except FileExistsError:
+            return objective(*args, **kwargs)
+        return threading.Event().wait()
+
+    training_block["objective"] = hanging_objective
+    training_block["MAX_EVALS"] = 4
+
+    with mlflow.start_run():
+        training_block["hyperopt_training"](
+            *training_splits(), parallelism=2, trials_db=None, trial_timeout=1
+        )
+
+    assert "timed out after 1 seconds" in capsys.readouterr().out
+    trial_runs = mlflow.search_runs(filter_string="tags.model != ''")
+    assert len(trial_runs) == 3
+    assert (trial_runs["status"] == "FINISHED").all()
+
+
+def test_evaluate_specs_fails_points_of_hung_workers(training_block):
+    def hanging_fn(params):
+        if params["x"] > 0.5:
+            threading.Event().wait()
+        return {"loss": params["x"], "status": STATUS_OK}
+
+    domain = Domain(hanging_fn, {"x": hp.uniform("x", 0, 1)})
+    results = training_block["evaluate_specs"](
+        domain, [{"x": 0.25}, {"x": 0.75}, {"x": 0.5}], 2, 1, timeout=1
+    )
+
+    assert results == [
+        {"loss": 0.25, "status": STATUS_OK},
+        None,
+        {"loss": 0.5, "status": STATUS_OK},
+    ]
+
+
+def test_trial_store_resumes_and_cleans_spilled_models(training_block, tmp_path):
+    splits = training_splits()
+    spilled_models = tmp_path / "trials_models"
+    log_top_models = training_block["log_top_models"]
+
+    def crash(*_):
+        raise RuntimeError("crashed before logging the models")
+
+    training_block["MAX_EVALS"] = 4
+    training_block["log_top_models"] = crash
+    with pytest.raises(RuntimeError, match="crashed"), mlflow.start_run():
+        training_block["hyperopt_training"](
+            *splits, parallelism=1, top_k=2, trials_db="trials.db"
+        )
+    # The models of a crashed search are kept for the resumed one.
+    assert len(list(spilled_models.rglob("*.pkl"))) == 4
+
+    training_block["MAX_EVALS"] = 6
+    training_block["log_top_models"] = log_top_models
+    with mlflow.start_run():
+        training_block["hyperopt_training"](
+            *splits, parallelism=1, top_k=2, trials_db="trials.db"
+        )
+    assert not list(spilled_models.rglob("*.pkl"))
+
+    runs = mlflow.search_runs(filter_string="tags.model_logged = 'true'")
+    trial_runs = mlflow.search_runs(filter_string="tags.model != ''")
+    assert len(trial_runs) == 6
+    assert (
+        sorted(runs["metrics.f1_score"]) == sorted(trial_runs["metrics.f1_score"])[-2:]
+    )
+    assert len(training_block["logged_models"]) == 2
+
+    training_block["MAX_EVALS"] = 7
+    with mlflow.start_run():
+        training_block["hyperopt_training"](
+            *splits, parallelism=1, top_k=2, trials_db="trials.db"
+        )
+    assert not list(spilled_models.rglob("*.pkl"))
+
+
+def test_successive_halving_keeps_no_spilled_models(training_block, tmp_path):
+    training_block["HALVING_CONFIGS"] = 6
+    training_block["HALVING_MIN_FRACTION"] = 1 / 3
+
+    with mlflow.start_run():
+        training_block["hyperopt_training"](
+            *training_splits(),
+            parallelism=1,
+            top_k=1,
+            search="halving",
+            trials_db="trials.db",
+        )
+
+    assert not list(tmp_path.rglob("*.pkl"))
+    assert len(training_block["logged_models"]) == 1
+    pruned = mlflow.search_runs(filter_string="tags.pruned = 'true'")
+    assert len(pruned) == 4
+
+
+def test_trial_models_keep_their_feature_names(training_block, tmp_path):
+    X_train, X_val, y_train, y_val = training_splits()
+    data = training_block["TrainingData"].save(
+        str(tmp_path / "data"), X_train, X_val, y_train, y_val
+    )
+    for params in (
+        {"type": "svm", "C": 1.0},
+        {"type": "rf", "max_depth": 5, "criterion": "gini"},
+        {"type": "dt", "criterion": "gini", "splitter": "best", "class_weight": None},
+        {"type": "xgb", "max_depth": 3, "n_estimators": 10},
+    ):
+        training_block["objective"](params, data)
+
+    for clf in training_block["logged_models"]:
+        assert list(clf.feature_names_in_) == FEATURE_COLUMNS
+        # Serving passes named columns, which must not warn.
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            clf.predict(X_val)
+
+
+def test_fit_xgb_matches_xgb_classifier_fit(training_block, tmp_path):
+    X_train, X_val, y_train, y_val = training_splits()
+    for name, target in (
+        ("multiclass", y_train),
+        ("binary", (y_train >= 2).astype(float)),
+    ):
+        data = training_block["TrainingData"].save(
+            str(tmp_path / name), X_train, X_val, target, y_val
+        )
+        params = {"max_depth": 3, "n_estimators": 10, "n_jobs": 1}
+        clf = training_block["fit_xgb"](training_block["XGBClassifier"](**params), data)
+        expected = training_block["XGBClassifier"](**params).fit(
+            X_train, target.to_numpy().ravel()
+        )
+
+        assert np.allclose(clf.predict_proba(X_val), expected.predict_proba(X_val))
@@ -0,0 +1,75 @@
+import sys
+import time
+import signal
+import socket
+import subprocess
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.tree import DecisionTreeRegressor
+
+project_root = Path(__file__).parents[2]
+sys.path.insert(0, str(project_root))
+
+from utils.prefork import share_arrays
+from utils.tree_compiler import compile_tree_model
+
+SERVER_SCRIPT = """
+import os, sys
+sys.path.insert(0, {project_root!r})
+from utils.prefork import PreforkServer
+
+def app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [str(os.getpid()).encode()]
+
+PreforkServer(app, host="127.0.0.1", port={port}, workers=2, max_requests=2).run()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get(url, retries=50):
+    for _ in range(retries):
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                return response.read().decode()
+        except OSError:
+            time.sleep(0.1)
+    raise AssertionError(f"{url} did not answer")
+
+
+def test_share_arrays_keeps_predictions():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.uniform(size=(200, 3)), columns=["a", "b", "c"])
+    y = X.sum(axis=1)
+    compiled = compile_tree_model(DecisionTreeRegressor(max_depth=6).fit(X, y))
+    expected = compiled.predict(X.to_numpy())
+
+    shared_bytes = share_arrays(compiled)
+
+    assert shared_bytes == compiled.nbytes
+    assert not compiled.threshold.flags.writeable
+    np.testing.assert_array_equal(compiled.predict(X.to_numpy()), expected)
+
+
+def test_prefork_server_recycles_workers():
+    port = free_port()
+    script = SERVER_SCRIPT.format(project_root=str(project_root), port=port)
+    with subprocess.Popen([sys.executable, "-c", script]) as server:
+        try:
+            pids = {get(f"http://127.0.0.1:{port}/") for _ in range(10)}
+        finally:
+            server.send_signal(signal.SIGTERM)
+            exit_code = server.wait(timeout=10)
+
+    # Two workers recycled every two requests serve ten requests with at
+    # least five different processes.
+    assert len(pids) >= 5
+    assert exit_code == 0
@@ -0,0 +1,126 @@
+import sys
+import json
+import base64
+import datetime
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(project_root))
+
+# pylint: disable=wrong-import-position
+from utils.stream_consumer import (
+    FileStream,
+    StreamConsumer,
+    CheckpointStore,
+    KinesisShardReader,
+    file_readers,
+)
+
+
+class RecordingHandler:
+    def __init__(self, poison=()):
+        self.poison = set(poison)
+        self.student_ids = []
+        self.calls = 0
+
+    def __call__(self, event):
+        self.calls += 1
+        failures = []
+        for record in event["Records"]:
+            student_event = json.loads(base64.b64decode(record["kinesis"]["data"]))
+            if student_event["student_id"] in self.poison:
+                failures.append({"itemIdentifier": record["kinesis"]["sequenceNumber"]})
+            else:
+                self.student_ids.append(student_event["student_id"])
+        return {"predictions": [], "batchItemFailures": failures}
+
+
+def put_students(file_stream, student_ids):
+    file_stream.put_records(
+        (str(student_id), json.dumps({"student": {}, "student_id": student_id}))
+        for student_id in student_ids
+    )
+
+
+def consume(file_stream, handler, checkpoints):
+    consumer = StreamConsumer(
+        file_readers(file_stream, checkpoints),
+        handler,
+        checkpoints,
+        batch_size=8,
+        window_seconds=0.0,
+        max_retries=2,
+        poll_interval=0.0,
+        stop_when_idle=True,
+    ).start()
+    consumer.join(timeout=10)
+    assert not consumer.running()
+    return consumer.report()
+
+
+def test_file_stream_consumer_retries_skips_and_checkpoints(tmp_path):
+    file_stream = FileStream(str(tmp_path / "stream"), shards=3)
+    put_students(file_stream, range(50))
+    checkpoint_path = str(tmp_path / "checkpoints.json")
+
+    handler = RecordingHandler(poison={7})
+    report = consume(file_stream, handler, CheckpointStore(checkpoint_path))
+
+    assert len(file_stream.shard_ids()) == 3
+    # Like Lambda, a retry starts from the failed record, so the records after
+    # it are delivered again.
+    assert set(handler.student_ids) == set(range(50)) - {7}
+    assert report["records"] == 49
+    assert sum(shard["skipped"] for shard in report["shards"].values()) == 1
+    assert sum(shard["retries"] for shard in report["shards"].values()) == 2
+
+    # A restart resumes after the checkpoints, only new records are read.
+    put_students(file_stream, range(50, 60))
+    handler = RecordingHandler()
+    report = consume(file_stream, handler, CheckpointStore(checkpoint_path))
+    assert sorted(handler.student_ids) == list(range(50, 60))
+
+
+class KinesisClientMock:
+    class exceptions:  # pylint: disable=invalid-name
+        class ProvisionedThroughputExceededException(Exception):
+            pass
+
+    def __init__(self):
+        self.iterator_requests = []
+
+    def get_shard_iterator(self, **kwargs):
+        self.iterator_requests.append(kwargs)
+        return {"ShardIterator": "iterator-1"}
+
+    def get_records(self, ShardIterator, Limit):  # pylint: disable=unused-argument
+        arrival = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        return {
+            "Records": [
+                {
+                    "SequenceNumber": "42",
+                    "PartitionKey": "1001",
+                    "Data": b'{"student_id": 1001}',
+                    "ApproximateArrivalTimestamp": arrival,
+                }
+            ],
+            "NextShardIterator": None,
+            "MillisBehindLatest": 1500,
+        }
+
+
+def test_kinesis_shard_reader_resumes_and_converts_records():
+    kinesis_client = KinesisClientMock()
+    reader = KinesisShardReader(
+        kinesis_client, "students", "shardId-000", after_sequence_number="41"
+    )
+
+    records, lag_ms = reader.read(10)
+
+    assert kinesis_client.iterator_requests[0]["ShardIteratorType"] == (
+        "AFTER_SEQUENCE_NUMBER"
+    )
+    assert lag_ms == 1500
+    assert reader.closed
+    assert records[0]["kinesis"]["sequenceNumber"] == "42"
+    assert base64.b64decode(records[0]["kinesis"]["data"]) == b'{"student_id": 1001}'
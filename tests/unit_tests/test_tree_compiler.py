@@ -0,0 +1,66 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBClassifier
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+
+project_root = Path(__file__).parents[2]
+sys.path.insert(0, str(project_root))
+
+from utils.preprocessing import FEATURE_COLUMNS
+from utils.tree_compiler import compile_tree_model
+
+
+def training_data(n=500):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.random((n, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    y = np.round(X["ParentalEducation"] * 3 + X["Absences"] * 2) % 5
+    return X, y.astype(int)
+
+
+@pytest.mark.parametrize(
+    "model",
+    [
+        DecisionTreeClassifier(random_state=0),
+        RandomForestClassifier(n_estimators=20, random_state=0),
+        XGBClassifier(n_estimators=10, max_depth=4),
+    ],
+)
+@pytest.mark.parametrize("float32_thresholds", [False, True])
+def test_compiled_predictions_are_identical(model, float32_thresholds):
+    X, y = training_data()
+    model.fit(X, y)
+    X_test, _ = training_data(1000)
+
+    compiled = compile_tree_model(
+        model, FEATURE_COLUMNS, float32_thresholds=float32_thresholds
+    )
+
+    np.testing.assert_array_equal(
+        compiled.predict(X_test.to_numpy()), model.predict(X_test)
+    )
+
+
+def test_compiled_xgboost_handles_missing_values():
+    X, y = training_data()
+    X.iloc[::7, 1] = np.nan
+    model = XGBClassifier(n_estimators=10, max_depth=4).fit(X, y)
+
+    compiled = compile_tree_model(model, FEATURE_COLUMNS)
+
+    np.testing.assert_array_equal(compiled.predict(X.to_numpy()), model.predict(X))
+
+
+def test_compiled_model_remaps_feature_order():
+    X, y = training_data()
+    model = DecisionTreeClassifier(random_state=0).fit(X, y)
+
+    compiled = compile_tree_model(model, FEATURE_COLUMNS[::-1])
+
+    np.testing.assert_array_equal(
+        compiled.predict(X[FEATURE_COLUMNS[::-1]].to_numpy()), model.predict(X)
+    )
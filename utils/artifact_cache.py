@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from functools import partial
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: entries are still published atomically
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+CONTENT_NAME = "content"
+
+
+def _entry_key(experiment_id, run_id, artifact_path):
+    raw_key = json.dumps([str(experiment_id), str(run_id), artifact_path])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+def _iter_files(path):
+    if os.path.isfile(path):
+        yield "", path
+        return
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            yield os.path.relpath(file_path, path).replace(os.sep, "/"), file_path
+
+
+def checksum(path):
+    digest = hashlib.sha256()
+    size = 0
+    for rel_path, file_path in _iter_files(path):
+        digest.update(rel_path.encode("utf-8") + b"\0")
+        with open(file_path, "rb") as f_in:
+            for block in iter(partial(f_in.read, 1 << 20), b""):
+                digest.update(block)
+                size += len(block)
+    return digest.hexdigest(), size
+
+
+@contextmanager
+def _locked(lock_path):
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class ArtifactCache:
+    """Persistent local cache of run artifacts.
+
+    Every entry lives in its own directory named after the hash of
+    (experiment_id, run_id, artifact_path) and holds the artifact plus a
+    manifest with its sha256. Entries are downloaded into a temporary
+    directory and renamed into place, downloads of the same entry are
+    serialised across processes with a lock file, and the least recently
+    used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, root, max_bytes=None, verify=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.verify = verify
+        self.locks_dir = os.path.join(root, "locks")
+        os.makedirs(self.locks_dir, exist_ok=True)
+
+    def entry_dir(self, experiment_id, run_id, artifact_path):
+        return os.path.join(self.root, _entry_key(experiment_id, run_id, artifact_path))
+
+    def fetch(self, experiment_id, run_id, artifact_path, download):
+        """Return the local path of the artifact, downloading it on a miss.
+
+        download(dst_dir) must write the artifact below dst_dir and return the
+        path of the downloaded file or folder.
+        """
+        key = _entry_key(experiment_id, run_id, artifact_path)
+        entry_dir = os.path.join(self.root, key)
+
+        with _locked(os.path.join(self.locks_dir, f"{key}.lock")):
+            local_path = self._read_entry(entry_dir)
+            if local_path is not None:
+                logger.info("Artifact cache hit for %s", artifact_path)
+                return local_path
+
+            logger.info("Artifact cache miss for %s, downloading", artifact_path)
+            local_path = self._download_entry(
+                entry_dir,
+                {
+                    "experiment_id": str(experiment_id),
+                    "run_id": str(run_id),
+                    "artifact_path": artifact_path,
+                },
+                download,
+            )
+
+        self.evict(keep=key)
+        return local_path
+
+    def _read_entry(self, entry_dir):
+        manifest_path = os.path.join(entry_dir, MANIFEST_NAME)
+        try:
+            with open(manifest_path, "rt", encoding="utf-8") as f_in:
+                manifest = json.load(f_in)
+        except (OSError, ValueError):
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        local_path = os.path.join(entry_dir, CONTENT_NAME, manifest["relative_path"])
+        if self.verify and checksum(local_path)[0] != manifest["sha256"]:
+            logger.warning("Checksum mismatch in %s, discarding the entry", entry_dir)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        os.utime(manifest_path)
+        return local_path
+
+    def _download_entry(self, entry_dir, manifest, download):
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            content_dir = os.path.join(tmp_dir, CONTENT_NAME)
+            os.makedirs(content_dir)
+            downloaded_path = download(content_dir)
+
+            sha256, size = checksum(downloaded_path)
+            manifest.update(
+                relative_path=os.path.relpath(downloaded_path, content_dir),
+                sha256=sha256,
+                size=size,
+                created_at=time.time(),
+            )
+            with open(
+                os.path.join(tmp_dir, MANIFEST_NAME), "wt", encoding="utf-8"
+            ) as f_out:
+                json.dump(manifest, f_out)
+
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.rename(tmp_dir, entry_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        return os.path.join(entry_dir, CONTENT_NAME, manifest["relative_path"])
+
+    def entries(self):
+        entries = []
+        for key in os.listdir(self.root):
+            manifest_path = os.path.join(self.root, key, MANIFEST_NAME)
+            try:
+                with open(manifest_path, "rt", encoding="utf-8") as f_in:
+                    size = json.load(f_in)["size"]
+                last_used = os.path.getmtime(manifest_path)
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, key, size))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+
+        entries = self.entries()
+        total_size = sum(size for _, _, size in entries)
+
+        for _, key, size in entries:
+            if total_size <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            with _locked(os.path.join(self.locks_dir, f"{key}.lock")):
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total_size -= size
+            logger.info("Evicted artifact cache entry %s (%d bytes)", key, size)
@@ -0,0 +1,142 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+# orjson parses several times faster than json, both raise ValueError.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+JSON_CONTENT_TYPE = "application/json"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+CONTENT_TYPES = {
+    JSON_CONTENT_TYPE: "json",
+    NDJSON_CONTENT_TYPE: "ndjson",
+    "application/jsonl": "ndjson",
+    "application/jsonlines": "ndjson",
+    ARROW_CONTENT_TYPE: "arrow",
+}
+
+ID_COLUMN = "StudentID"
+
+
+class BatchFormatError(ValueError):
+    pass
+
+
+class BatchTooLargeError(ValueError):
+    pass
+
+
+class UnsupportedMediaTypeError(ValueError):
+    pass
+
+
+def batch_format(content_type):
+    mimetype = (content_type or JSON_CONTENT_TYPE).split(";")[0].strip().lower()
+    try:
+        return CONTENT_TYPES[mimetype]
+    except KeyError as e:
+        raise UnsupportedMediaTypeError(
+            f"Unsupported content type {mimetype}, "
+            f"expected one of {sorted(CONTENT_TYPES)}"
+        ) from e
+
+
+def _check_size(n_records, max_batch_size):
+    if max_batch_size is not None and n_records > max_batch_size:
+        raise BatchTooLargeError(
+            f"Batch of {n_records} records exceeds the maximum of {max_batch_size}"
+        )
+
+
+def _check_records(records):
+    for i, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise BatchFormatError(f"Record {i} is not a JSON object")
+    return records
+
+
+def decode_json(body, max_batch_size=None):
+    try:
+        records = json_loads(body)
+    except ValueError as e:
+        raise BatchFormatError(f"Invalid JSON body: {e}") from e
+    if not isinstance(records, list):
+        raise BatchFormatError("The JSON body must be an array of students")
+    _check_size(len(records), max_batch_size)
+    return _check_records(records)
+
+
+def decode_ndjson(body, max_batch_size=None):
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+
+    records = []
+    for line_number, line in enumerate(body.splitlines(), start=1):
+        if not line.strip():
+            continue
+        _check_size(len(records) + 1, max_batch_size)
+        try:
+            records.append(json_loads(line))
+        except ValueError as e:
+            raise BatchFormatError(f"Invalid JSON on line {line_number}: {e}") from e
+    return _check_records(records)
+
+
+def decode_arrow(body, max_batch_size=None):
+    import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+    try:
+        table = pa.ipc.open_stream(body).read_all()
+    except (pa.ArrowInvalid, OSError) as e:
+        raise BatchFormatError(f"Invalid Arrow IPC stream: {e}") from e
+    _check_size(table.num_rows, max_batch_size)
+    return table.to_pandas()
+
+
+DECODERS = {"json": decode_json, "ndjson": decode_ndjson, "arrow": decode_arrow}
+
+
+def decode_batch(body, content_type, max_batch_size=None):
+    """Decode a request body into a list of student dicts or a DataFrame.
+
+    Arrow IPC streams become a DataFrame and JSON bodies a list of dicts.
+    Both can go straight to ModelService.predict_records.
+    """
+    return DECODERS[batch_format(content_type)](body, max_batch_size)
+
+
+def student_ids(students):
+    if isinstance(students, pd.DataFrame):
+        if ID_COLUMN not in students:
+            return [None] * len(students)
+        return students[ID_COLUMN].tolist()
+    return [student.get(ID_COLUMN) for student in students]
+
+
+def encode_predictions(ids, predictions, fmt):
+    """Encode the predictions in the request format and return (body, mimetype)."""
+    if fmt == "arrow":
+        import pyarrow as pa  # pylint: disable=import-outside-toplevel
+
+        table = pa.table(
+            {ID_COLUMN: ids, "GPA": np.asarray(predictions, dtype=np.float64)}
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_CONTENT_TYPE
+
+    rows = [
+        {ID_COLUMN: student_id, "GPA": float(pred)}
+        for student_id, pred in zip(ids, predictions)
+    ]
+    if fmt == "ndjson":
+        body = "".join(json.dumps(row) + "\n" for row in rows)
+        return body.encode("utf-8"), NDJSON_CONTENT_TYPE
+    return json.dumps(rows).encode("utf-8"), JSON_CONTENT_TYPE
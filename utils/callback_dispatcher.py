@@ -0,0 +1,164 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUEUE_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+_STOP = object()
+
+
+def callback_name(callback):
+    return getattr(callback, "__qualname__", None) or type(callback).__name__
+
+
+class CallbackDispatcher:  # pylint: disable=too-many-instance-attributes
+    """Runs prediction callbacks on worker threads fed by a bounded queue.
+
+    The dispatcher is itself a callback: calling it enqueues the event once
+    per wrapped callback and returns. When the queue is full, "block" waits
+    for room (up to put_timeout seconds), "drop_newest" discards the new
+    event and "drop_oldest" discards the oldest queued one. flush() waits for
+    the queue to drain and then flushes the wrapped callbacks. With more
+    than one worker, events may reach a callback out of order.
+    """
+
+    def __init__(
+        self,
+        callbacks,
+        *,
+        max_queue_size=1000,
+        workers=2,
+        policy="block",
+        put_timeout=None,
+    ):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"policy must be one of {QUEUE_POLICIES}, got {policy}")
+
+        self.callbacks = [(callback_name(callback), callback) for callback in callbacks]
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self._stats = {
+            name: {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            for name, _ in self.callbacks
+        }
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._workers = [
+            threading.Thread(
+                target=self._work, name=f"callback-worker-{i}", daemon=True
+            )
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        atexit.register(self.close)
+
+    def __call__(self, prediction_event):
+        for name, callback in self.callbacks:
+            self._put((name, callback, prediction_event))
+
+    def _put(self, item):
+        if self.policy == "block":
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self._drop(item)
+            return
+
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                if self.policy == "drop_newest":
+                    self._drop(item)
+                    return
+                try:
+                    self._drop(self._queue.get_nowait())
+                    self._queue.task_done()
+                except queue.Empty:
+                    pass
+
+    def _drop(self, item):
+        with self._stats_lock:
+            self.dropped += 1
+        logger.warning("Callback queue full, dropped an event for %s", item[0])
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            name, callback, prediction_event = item
+            failed = False
+            start = time.perf_counter()
+            try:
+                callback(prediction_event)
+            except Exception as e:
+                failed = True
+                logger.error("Callback %s failed: %s", name, e, exc_info=True)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._stats_lock:
+                    stats = self._stats[name]
+                    stats["calls"] += 1
+                    stats["errors"] += failed
+                    stats["total_seconds"] += elapsed
+                    stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+                self._queue.task_done()
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def flush(self, timeout=None):
+        drained = self.join(timeout)
+        if not drained:
+            logger.warning("Callback queue not drained within %s seconds", timeout)
+
+        for _, callback in self.callbacks:
+            flush = getattr(callback, "flush", None)
+            if flush is not None:
+                flush()
+
+        return drained
+
+    def close(self, timeout=None):
+        if not any(worker.is_alive() for worker in self._workers):
+            return
+        self.flush(timeout)
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "dropped": self.dropped,
+                "queued": self._queue.qsize(),
+                "callbacks": {
+                    name: {
+                        **stats,
+                        "mean_seconds": (
+                            stats["total_seconds"] / stats["calls"]
+                            if stats["calls"]
+                            else 0.0
+                        ),
+                    }
+                    for name, stats in self._stats.items()
+                },
+            }
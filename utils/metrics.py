@@ -0,0 +1,186 @@
+import time
+import bisect
+import threading
+
+# Upper bounds in seconds, from 1 us to 10 s.
+DEFAULT_BUCKETS = (
+    0.000001,
+    0.0000025,
+    0.000005,
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    __slots__ = ("buckets", "bounds_ns", "counts", "count", "sum_ns", "max_ns")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bounds_ns = [int(bound * 1e9) for bound in self.buckets]
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum_ns += other.sum_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def quantile(self, q):
+        # Upper bound of the bucket that holds the q-th observation.
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max_ns / 1e9
+
+
+class StageMetrics:
+    """Fixed-bucket latency histograms and counters for the serving stages.
+
+    Stages are timed with perf_counter_ns: observe(stage, start) records the
+    time since start and returns the current time, so consecutive stages
+    share one clock read. Every thread writes to its own histograms, so the
+    hot path takes no lock; readers merge them.
+    """
+
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, stage, start):
+        now = time.perf_counter_ns()
+        try:
+            histogram = self._local.shard[0][stage]
+        except (AttributeError, KeyError):
+            histogram = self._shard()[0].setdefault(stage, Histogram(self.buckets))
+        elapsed_ns = now - start
+        histogram.counts[bisect.bisect_left(histogram.bounds_ns, elapsed_ns)] += 1
+        histogram.count += 1
+        histogram.sum_ns += elapsed_ns
+        histogram.max_ns = max(histogram.max_ns, elapsed_ns)
+        return now
+
+    def incr(self, name, value=1):
+        counters = self._shard()[1]
+        counters[name] = counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            for histograms, counters in self._shards:
+                histograms.clear()
+                counters.clear()
+
+    def merged(self, reset=False):
+        histograms, counters = {}, {}
+        with self._lock:
+            for shard_histograms, shard_counters in self._shards:
+                for stage, histogram in list(shard_histograms.items()):
+                    histograms.setdefault(stage, Histogram(self.buckets)).merge(
+                        histogram
+                    )
+                for name, value in list(shard_counters.items()):
+                    counters[name] = counters.get(name, 0) + value
+                if reset:
+                    shard_histograms.clear()
+                    shard_counters.clear()
+        return histograms, counters
+
+    def summary(self, reset=False):
+        histograms, counters = self.merged(reset)
+        return {
+            "stages": {
+                stage: {
+                    "count": histogram.count,
+                    "sum_seconds": histogram.sum_ns / 1e9,
+                    "mean_seconds": histogram.sum_ns / histogram.count / 1e9,
+                    "max_seconds": histogram.max_ns / 1e9,
+                    "p50_seconds": histogram.quantile(0.5),
+                    "p99_seconds": histogram.quantile(0.99),
+                }
+                for stage, histogram in sorted(histograms.items())
+            },
+            "counters": counters,
+        }
+
+    def to_prometheus(self, prefix="student_performance"):
+        histograms, counters = self.merged()
+        name = f"{prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each serving stage.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}'
+            )
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum_ns / 1e9}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        for counter, value in sorted(counters.items()):
+            counter_name = f"{prefix}_{counter}_total"
+            lines.append(f"# TYPE {counter_name} counter")
+            lines.append(f"{counter_name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics:  # pylint: disable=unused-argument
+    enabled = False
+
+    def observe(self, stage, start):
+        return start
+
+    def incr(self, name, value=1):
+        pass
+
+    def summary(self, reset=False):
+        return {"stages": {}, "counters": {}}
+
+    def to_prometheus(self, prefix="student_performance"):
+        return ""
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,109 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:  # pylint: disable=too-many-instance-attributes
+    """Groups concurrent single-record predictions into micro-batches.
+
+    Request threads submit one record each and wait on a Future. A single
+    worker takes the first pending record, keeps collecting until
+    max_batch_size records are queued or max_wait_seconds have passed, and
+    scores the whole batch with one predict_batch call.
+
+    A record may be submitted with a context, such as the serving state it
+    was validated against. Records of the same context are scored together
+    with predict_batch(records, context), never mixed with another context.
+    """
+
+    def __init__(self, predict_batch, *, max_batch_size=64, max_wait_seconds=0.002):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.batches = 0
+        self.records = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._work, name="micro-batcher", daemon=True
+        )
+        self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, record, context=None):
+        future = Future()
+        self._queue.put((record, context, future))
+        return future
+
+    def predict(self, record, timeout=None, context=None):
+        return self.submit(record, context).result(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _work(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+
+            groups = {}
+            for item in self._collect(first):
+                groups.setdefault(id(item[1]), []).append(item)
+            for group in groups.values():
+                self._score(group)
+
+    def _score(self, batch):
+        records = [record for record, _, _ in batch]
+        context = batch[0][1]
+        try:
+            if context is None:
+                predictions = self.predict_batch(records)
+            else:
+                predictions = self.predict_batch(records, context)
+        except Exception as e:
+            logger.error("Micro-batch of %d records failed: %s", len(batch), e)
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.records += len(batch)
+        for (_, _, future), prediction in zip(batch, predictions):
+            future.set_result(prediction)
+
+    def close(self, timeout=None):
+        if self._worker.is_alive():
+            self._queue.put(_STOP)
+            self._worker.join(timeout)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "records": self.records,
+            "mean_batch_size": self.records / self.batches if self.batches else 0.0,
+        }
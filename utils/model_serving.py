@@ -1,25 +1,51 @@
+# pylint: disable=too-many-lines
 import os
 import json
+import time
 import base64
 import pickle
 import logging
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
 
-import boto3
-import mlflow
+import numpy as np
 import pandas as pd
-from mlflow import MlflowClient
+
+from utils.metrics import NULL_METRICS, StageMetrics
+from utils.micro_batcher import MicroBatcher
+from utils.preprocessing import FEATURE_COLUMNS, PreprocessingPlan
+from utils.tree_compiler import compile_tree_model
+from utils.artifact_cache import ArtifactCache
+from utils.serving_bundle import (
+    unwrap_model,
+    bundle_filename,
+    read_serving_bundle,
+    write_serving_bundle,
+)
+from utils.payload_logging import PayloadLogger
+from utils.prediction_cache import PredictionCache
+from utils.callback_dispatcher import CallbackDispatcher
 
 logging.basicConfig(
     level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-logger.setLevel(10)
+logger.setLevel(os.getenv("LOG_LEVEL") or "INFO")
+
+DEFAULT_CHUNK_SIZE = 100_000
 
+# PutRecords limits: 500 records and 5 MB per call, 1 MB per record (data plus
+# partition key).
+KINESIS_MAX_RECORDS_PER_CALL = 500
+KINESIS_MAX_BYTES_PER_CALL = 5 * 1024 * 1024
+KINESIS_MAX_BYTES_PER_RECORD = 1024 * 1024
 
-def load_models(need_scaler):
+
+def load_models(need_scaler, run_id=None):
 
     BUCKET_NAME = os.getenv("BUCKET_NAME")
-    RUN_ID = os.getenv("RUN_ID")
+    RUN_ID = run_id or os.getenv("RUN_ID")
     ARTIFACT_FOLDER = os.getenv("ARTIFACT_FOLDER")
     MLFLOW_TRACKING_URI = os.getenv("MLFLOW_TRACKING_URI")
     EXPERIMENT_ID = os.getenv("EXPERIMENT_ID")
@@ -42,18 +68,58 @@ def load_models(need_scaler):
     artefacts_uri = f"s3://{BUCKET_NAME}/{EXPERIMENT_ID}/{RUN_ID}/artifacts"
 
     print(artefacts_uri)
-    model = load_model(artefacts_uri, "mlruns")
+    artifact_cache = create_artifact_cache()
+    model = load_model(
+        artefacts_uri,
+        "mlruns",
+        artifact_cache=artifact_cache,
+        experiment_id=EXPERIMENT_ID,
+        run_id=RUN_ID,
+    )
 
     if need_scaler:
         scaler = load_scaler(
-            artefacts_uri, MLFLOW_TRACKING_URI, RUN_ID, ARTIFACT_FOLDER
+            artefacts_uri,
+            MLFLOW_TRACKING_URI,
+            RUN_ID,
+            ARTIFACT_FOLDER,
+            artifact_cache=artifact_cache,
+            experiment_id=EXPERIMENT_ID,
         )
 
     return model, scaler
 
 
-def load_model(artefacts_uri, MODEL_FOLDER):
+def create_artifact_cache():
+    cache_dir = os.getenv("ARTIFACT_CACHE_DIR")
+    if not cache_dir:
+        return None
+
+    max_mb = os.getenv("ARTIFACT_CACHE_MAX_MB")
+    max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+    logger.info("Using artifact cache at %s (max bytes: %s)", cache_dir, max_bytes)
+    return ArtifactCache(cache_dir, max_bytes=max_bytes)
+
+
+def load_model(
+    artefacts_uri, MODEL_FOLDER, *, artifact_cache=None, experiment_id=None, run_id=None
+):
+    # mlflow and boto3 are imported on use so that services loaded from a
+    # serving bundle never pay for them.
+    import mlflow  # pylint: disable=import-outside-toplevel
+
     model_uri = f"{artefacts_uri}/{MODEL_FOLDER}"
+
+    if artifact_cache is not None:
+        model_uri = artifact_cache.fetch(
+            experiment_id,
+            run_id,
+            MODEL_FOLDER,
+            lambda dst_path: mlflow.artifacts.download_artifacts(
+                artifact_uri=model_uri, dst_path=dst_path
+            ),
+        )
+
     model = mlflow.pyfunc.load_model(model_uri)
     return model
 
@@ -65,107 +131,426 @@ def load_binary_file_from_local_path(file_path):
     return content
 
 
-def load_scaler(artefacts_uri, MLFLOW_TRACKING_URI, RUN_ID, ARTIFACT_FOLDER):
+def download_scaler(
+    artefacts_uri, MLFLOW_TRACKING_URI, RUN_ID, ARTIFACT_FOLDER, dst_path="."
+):
     artefacts_uri = artefacts_uri + f"/{ARTIFACT_FOLDER}/minmax_scaler.bin"
-    artifact_path = os.path.join(ARTIFACT_FOLDER, "minmax_scaler.bin")
+    artifact_path = os.path.join(dst_path, ARTIFACT_FOLDER, "minmax_scaler.bin")
 
-    if not os.path.exists(artifact_path):
-        if MLFLOW_TRACKING_URI:
-            client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
-            client.download_artifacts(run_id=RUN_ID, path=ARTIFACT_FOLDER, dst_path=".")
-        else:
-            s3 = boto3.resource("s3")
-            parts = artefacts_uri.removeprefix("s3://").split("/", 1)
-            bucket, key = parts
+    if MLFLOW_TRACKING_URI:
+        from mlflow import MlflowClient  # pylint: disable=import-outside-toplevel
+
+        client = MlflowClient(tracking_uri=MLFLOW_TRACKING_URI)
+        client.download_artifacts(
+            run_id=RUN_ID, path=ARTIFACT_FOLDER, dst_path=dst_path
+        )
+    else:
+        import boto3  # pylint: disable=import-outside-toplevel
+
+        s3 = boto3.resource("s3")
+        parts = artefacts_uri.removeprefix("s3://").split("/", 1)
+        bucket, key = parts
+
+        os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+        print(bucket, key)
+        with open(artifact_path, "wb") as data:
+            s3.Bucket(bucket).download_fileobj(key, data)
+
+    return artifact_path
+
+
+def load_scaler(
+    artefacts_uri,
+    MLFLOW_TRACKING_URI,
+    RUN_ID,
+    ARTIFACT_FOLDER,
+    *,
+    artifact_cache=None,
+    experiment_id=None,
+):
+    download_args = (artefacts_uri, MLFLOW_TRACKING_URI, RUN_ID, ARTIFACT_FOLDER)
 
-            os.makedirs(ARTIFACT_FOLDER, exist_ok=True)
-            print(bucket, key)
-            with open(artifact_path, "wb") as data:
-                s3.Bucket(bucket).download_fileobj(key, data)
+    if artifact_cache is not None:
+        artifact_path = artifact_cache.fetch(
+            experiment_id,
+            RUN_ID,
+            f"{ARTIFACT_FOLDER}/minmax_scaler.bin",
+            lambda dst_path: download_scaler(*download_args, dst_path=dst_path),
+        )
+    else:
+        artifact_path = os.path.join(ARTIFACT_FOLDER, "minmax_scaler.bin")
+        if not os.path.exists(artifact_path):
+            download_scaler(*download_args)
 
     scaler = load_binary_file_from_local_path(artifact_path)
 
     return scaler
 
 
+ServingState = namedtuple("ServingState", ["model", "scaler", "plan", "model_version"])
+
+
 def base64_decode(encoded_data):
     decoded_data = base64.b64decode(encoded_data).decode("utf-8")
     ride_event = json.loads(decoded_data)
     return ride_event
 
 
-class ModelService:
-    def __init__(self, model, scaler, model_version=None, callbacks=None):
-        self.model, self.scaler = model, scaler
-        self.model_version = model_version
+class ModelService:  # pylint: disable=too-many-public-methods,too-many-instance-attributes
+    def __init__(
+        self,
+        model,
+        scaler,
+        model_version=None,
+        callbacks=None,
+        *,
+        batch_records=False,
+        cache=None,
+        plan=None,
+        metrics=None,
+        payload_logger=None,
+        report_batch_item_failures=False,
+    ):
         self.callbacks = callbacks or []
+        self.batch_records = batch_records
+        self.report_batch_item_failures = report_batch_item_failures
+        self.cache = cache
+        self.metrics = metrics or NULL_METRICS
+        self.payload_logger = payload_logger or PayloadLogger(logger)
+        self._local = threading.local()
+        if plan is None and scaler is not None:
+            plan = PreprocessingPlan.from_scaler(scaler)
+        # model, scaler, plan and model_version are replaced together, so a
+        # swap never pairs a model with the scaler of another version.
+        self._state = ServingState(model, scaler, plan, model_version)
         logger.info("ModelService initialized with model version: %s", model_version)
 
+    @property
+    def state(self):
+        return getattr(self._local, "state", None) or self._state
+
+    @property
+    def model(self):
+        return self.state.model
+
+    @model.setter
+    def model(self, model):
+        self._state = self._state._replace(model=model)
+
+    @property
+    def scaler(self):
+        return self.state.scaler
+
+    @scaler.setter
+    def scaler(self, scaler):
+        self._state = self._state._replace(scaler=scaler)
+
+    @property
+    def plan(self):
+        return self.state.plan
+
+    @plan.setter
+    def plan(self, plan):
+        self._state = self._state._replace(plan=plan)
+
+    @property
+    def model_version(self):
+        return self.state.model_version
+
+    @model_version.setter
+    def model_version(self, model_version):
+        self._state = self._state._replace(model_version=model_version)
+
+    @contextmanager
+    def pinned(self, state=None):
+        # Every read of the model, scaler, plan and version inside the block
+        # sees the same state, even if another thread swaps the model. state
+        # pins a state taken earlier, possibly by another thread.
+        if getattr(self._local, "state", None) is not None:
+            yield self._local.state
+            return
+        self._local.state = state or self._state
+        try:
+            yield self._local.state
+        finally:
+            self._local.state = None
+
+    def swap(self, model, scaler=None, model_version=None, plan=None):
+        if plan is None:
+            plan = (
+                PreprocessingPlan.from_scaler(scaler)
+                if scaler is not None
+                else self._state.plan
+            )
+        previous_state = self._state
+        self._state = ServingState(model, scaler, plan, model_version)
+        logger.info(
+            "Swapped model version %s for %s",
+            previous_state.model_version,
+            model_version,
+        )
+        return previous_state
+
+    def restore(self, state):
+        self._state = state
+        logger.info("Restored model version %s", state.model_version)
+
+    def preprocess_array(self, raw_data, copy=True):
+        if self.plan is None:
+            raise ValueError("ModelService needs a scaler to preprocess raw data")
+        start = time.perf_counter_ns()
+        features = self.plan.transform(raw_data, copy)
+        self.metrics.observe("preprocess", start)
+        logger.debug("Preprocessed %d records", features.shape[0])
+        return features
+
     def preprocessing(self, raw_data: pd.DataFrame):
-        logger.info("Starting preprocessing")
-        new_data = raw_data.copy()
-        minmax_cols = [
-            "ParentalEducation",
-            "StudyTimeWeekly",
-            "Absences",
-            "ParentalSupport",
-        ]
-        x_sc = self.scaler.transform(raw_data.loc[:, minmax_cols])
-        new_data.loc[:, minmax_cols] = x_sc
-
-        columns_to_drop = ["StudentID", "Age", "Gender", "Ethnicity"]
-        new_data.drop(columns_to_drop, axis=1, inplace=True)
-
-        logger.info("Preprocessed data: %s", new_data.to_dict())
-        return new_data
+        logger.debug("Starting preprocessing")
+        features = self.preprocess_array(raw_data)
+        return self.plan.to_frame(features, index=raw_data.index)
+
+    def model_input(self, features):
+        if isinstance(features, pd.DataFrame) or getattr(
+            self.model, "accepts_array", False
+        ):
+            return features
+        # The estimators were fitted on named columns, so the array is only
+        # wrapped (not copied) to keep the feature names around.
+        return self.plan.to_frame(features)
+
+    def predict_array(self, features):
+        start = time.perf_counter_ns()
+        pred = self.model.predict(self.model_input(features))
+        self.metrics.observe("predict", start)
+        return np.asarray(pred, dtype=np.float64)
 
     def only_predict(self, features):
+        start = time.perf_counter_ns()
         pred = self.model.predict(features)
-        logger.info("Prediction result: %f", float(pred[0]))
+        self.metrics.observe("predict", start)
+        logger.debug("Prediction result: %s", pred[0])
         return float(pred[0])
 
-    def predict(self, raw_record):
-        logger.info("Starting prediction for raw data: %s", raw_record)
-        df_data = pd.DataFrame([raw_record])
-        features = self.preprocessing(df_data)
-        pred = self.only_predict(features)
+    def predict(self, raw_record, copy=True):
+        self.payload_logger.log("Starting prediction for raw data", raw_record)
+        with self.pinned():
+            features = self.preprocess_array(raw_record, copy)
+            if self.cache is not None:
+                return self.cached_predict(features)[0]
+            pred = self.only_predict(self.model_input(features))
         return pred
 
-    def batch_predict(self, raw_data: pd.DataFrame):
-        logger.info("Starting prediction for raw data. Head: %s", raw_data)
-        features = self.preprocessing(raw_data)
-        pred = self.only_predict(features)
+    def cached_predict(self, features):
+        start = time.perf_counter_ns()
+        self.cache.bind(self.model_version)
+        keys = [self.cache.key(row, self.model_version) for row in features]
+        predictions = [self.cache.get(key) for key in keys]
+        self.metrics.observe("cache_lookup", start)
 
-        return pred
+        missing = [i for i, pred in enumerate(predictions) if pred is None]
+        if missing:
+            missing_predictions = self.predict_array(features[missing]).tolist()
+            for i, pred in zip(missing, missing_predictions):
+                predictions[i] = pred
+                self.cache.put(keys[i], pred)
 
-    def lambda_handler(self, event):
-        logger.info("Lambda handler received event: %s", event)
+        return predictions
 
-        predictions_events = []
+    def predict_records(self, raw_records, state=None, copy=True):
+        logger.debug("Starting prediction for %d raw records", len(raw_records))
+        with self.pinned(state):
+            features = self.preprocess_array(raw_records, copy)
+            if self.cache is not None:
+                return self.cached_predict(features)
+            pred = self.predict_array(features)
+        return pred.tolist()
 
-        for record in event["Records"]:
-            encoded_data = record["kinesis"]["data"]
-            logger.info("Encoded data from Kinesis: %s", encoded_data)
-            student_event = base64_decode(encoded_data)
+    def iter_batch_predict(
+        self,
+        raw_data: pd.DataFrame,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        preprocess: bool = True,
+    ):
+        # preprocess=False scores raw_data as it is, for frames that already
+        # hold the model features.
+        if chunk_size < 1:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+        for start in range(0, len(raw_data), chunk_size):
+            chunk = raw_data.iloc[start : start + chunk_size]
+            with self.pinned():
+                features = self.preprocess_array(chunk) if preprocess else chunk
+                chunk_pred = self.predict_array(features)
+            yield chunk.index, chunk_pred
+
+    def batch_predict(
+        self,
+        raw_data: pd.DataFrame,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        preprocess: bool = True,
+    ) -> np.ndarray:
+        logger.info("Starting batch prediction for %d rows", len(raw_data))
+        predictions = np.empty(len(raw_data), dtype=np.float64)
+
+        start = 0
+        for _, chunk_pred in self.iter_batch_predict(raw_data, chunk_size, preprocess):
+            predictions[start : start + len(chunk_pred)] = chunk_pred
+            start += len(chunk_pred)
 
-            student = student_event["student"]
-            student_id = student_event["student_id"]
+        return predictions
 
-            prediction = self.predict(student)
+    def flush_callbacks(self):
+        start = time.perf_counter_ns()
+        for callback in self.callbacks:
+            flush = getattr(callback, "flush", None)
+            if flush is not None:
+                flush()
+        self.metrics.observe("callbacks_flush", start)
 
-            prediction_event = {
-                "model": "student-performance",
-                "version": self.model_version,
-                "prediction": {"GPA": prediction, "student_id": student_id},
-            }
+    def prediction_event(self, prediction, student_id):
+        return {
+            "model": "student-performance",
+            "version": self.model_version,
+            "prediction": {"GPA": prediction, "student_id": student_id},
+        }
 
+    def decode_record(self, record):
+        start = time.perf_counter_ns()
+        decoded_data = base64.b64decode(record["kinesis"]["data"])
+        start = self.metrics.observe("base64_decode", start)
+        student_event = json.loads(decoded_data)
+        self.metrics.observe("json_parse", start)
+        return student_event
+
+    def run_callbacks(self, predictions_events):
+        start = time.perf_counter_ns()
+        for prediction_event in predictions_events:
             for callback in self.callbacks:
                 callback(prediction_event)
+        self.metrics.observe("callbacks", start)
+
+    def log_metrics(self):
+        if self.metrics.enabled:
+            logger.info(
+                "%s", json.dumps({"serving_metrics": self.metrics.summary(reset=True)})
+            )
+
+    def lambda_handler(self, event):
+        start = time.perf_counter_ns()
+        logger.info(
+            "Lambda handler received %d records for model version %s",
+            len(event["Records"]),
+            self.model_version,
+        )
+        log_payloads = self.payload_logger.sampled()
+        if log_payloads:
+            self.payload_logger.emit("Lambda handler received event", event)
+
+        if self.batch_records:
+            result = self.batch_lambda_handler(event)
+        else:
+            result = self.record_lambda_handler(event)
+
+        if log_payloads:
+            self.payload_logger.emit("Prediction events", result["predictions"])
+
+        self.metrics.observe("lambda_handler", start)
+        self.metrics.incr("records", len(event["Records"]))
+        if result.get("batchItemFailures"):
+            self.metrics.incr("failed_records", len(result["batchItemFailures"]))
+        self.log_metrics()
+
+        return result
+
+    def record_failure(self, record, error):
+        sequence_number = record.get("kinesis", {}).get("sequenceNumber")
+        logger.warning(
+            "Record %s failed: %s: %s", sequence_number, type(error).__name__, error
+        )
+        return {"itemIdentifier": sequence_number}
+
+    def handler_result(self, predictions_events, failures):
+        # Lambda only retries the records listed in batchItemFailures (from
+        # the lowest sequence number on); an empty list acknowledges the batch.
+        if not self.report_batch_item_failures:
+            return {"predictions": predictions_events}
+        return {"predictions": predictions_events, "batchItemFailures": failures}
+
+    def record_lambda_handler(self, event):
+        predictions_events = []
+        failures = []
+
+        for record in event["Records"]:
+            try:
+                student_event = self.decode_record(record)
+
+                student = student_event["student"]
+                student_id = student_event["student_id"]
+
+                with self.pinned():
+                    prediction = self.predict(student)
+                    prediction_event = self.prediction_event(prediction, student_id)
+
+                self.run_callbacks([prediction_event])
+            except Exception as e:
+                if not self.report_batch_item_failures:
+                    raise
+                failures.append(self.record_failure(record, e))
+                continue
 
             predictions_events.append(prediction_event)
-        logger.info("Prediction events: %s", predictions_events)
+        self.flush_callbacks()
+
+        return self.handler_result(predictions_events, failures)
+
+    def isolated_predictions(self, decoded, failures):
+        # A single bad record fails predict_records for the whole batch, so
+        # the records are scored one by one to find the ones that fail.
+        predictions = []
+        for record, student, _ in decoded:
+            try:
+                predictions.append(self.predict(student))
+            except Exception as e:
+                failures.append(self.record_failure(record, e))
+                predictions.append(None)
+        return predictions
+
+    def batch_lambda_handler(self, event):
+        decoded = []
+        failures = []
+        for record in event["Records"]:
+            try:
+                student_event = self.decode_record(record)
+                student = student_event["student"]
+                student_id = student_event["student_id"]
+            except Exception as e:
+                if not self.report_batch_item_failures:
+                    raise
+                failures.append(self.record_failure(record, e))
+                continue
+            decoded.append((record, student, student_id))
+        if not decoded:
+            return self.handler_result([], failures)
+
+        students = [student for _, student, _ in decoded]
+
+        with self.pinned():
+            try:
+                predictions = self.predict_records(students)
+            except Exception:
+                if not self.report_batch_item_failures:
+                    raise
+                predictions = self.isolated_predictions(decoded, failures)
+            predictions_events = [
+                self.prediction_event(prediction, student_id)
+                for (_, _, student_id), prediction in zip(decoded, predictions)
+                if prediction is not None
+            ]
 
-        return {"predictions": predictions_events}
+        self.run_callbacks(predictions_events)
+        self.flush_callbacks()
+
+        return self.handler_result(predictions_events, failures)
 
 
 class KinesisCallback:
@@ -178,19 +563,378 @@ class KinesisCallback:
 
     def put_record(self, prediction_event):
         student_id = prediction_event["prediction"]["student_id"]
-        logger.info("Adding Kinesis record for student ID: %s", student_id)
+        logger.debug("Adding Kinesis record for student ID: %s", student_id)
         try:
             response = self.kinesis_client.put_record(
                 StreamName=self.prediction_stream_name,
                 Data=json.dumps(prediction_event),
                 PartitionKey=str(student_id),
             )
-            logger.info("Kinesis record added with response: %s", response)
+            logger.debug("Kinesis record added with response: %s", response)
         except Exception as e:
             logger.error("Failed to add Kinesis record: %s", e, exc_info=True)
 
 
+class BufferedKinesisCallback:  # pylint: disable=too-many-instance-attributes
+    """Collects prediction events and sends them with PutRecords on flush.
+
+    Entries rejected by Kinesis (e.g. throttled shards) are retried with
+    exponential backoff; whatever still fails after max_retries is dropped
+    and counted.
+    """
+
+    def __init__(
+        self,
+        kinesis_client,
+        prediction_stream_name,
+        *,
+        max_retries=3,
+        backoff_seconds=0.1,
+        sleep=time.sleep,
+    ):
+        self.kinesis_client = kinesis_client
+        self.prediction_stream_name = prediction_stream_name
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.sleep = sleep
+        self.stats = {"delivered": 0, "dropped": 0, "retried": 0}
+        self._buffer = []
+        self._lock = threading.Lock()
+        logger.info(
+            "Initialized BufferedKinesisCallback with stream name: %s",
+            prediction_stream_name,
+        )
+
+    def __call__(self, prediction_event):
+        self.put_record(prediction_event)
+
+    def put_record(self, prediction_event):
+        entry = {
+            "Data": json.dumps(prediction_event).encode("utf-8"),
+            "PartitionKey": str(prediction_event["prediction"]["student_id"]),
+        }
+        with self._lock:
+            self._buffer.append(entry)
+
+    def flush(self):
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+
+        result = {"delivered": 0, "dropped": 0, "retried": 0}
+        for chunk in self._chunks(entries, result):
+            self._put_chunk(chunk, result)
+
+        for key, value in result.items():
+            self.stats[key] += value
+        if entries:
+            logger.info("Flushed Kinesis records: %s", result)
+        return result
+
+    @staticmethod
+    def _entry_size(entry):
+        return len(entry["Data"]) + len(entry["PartitionKey"].encode("utf-8"))
+
+    def _chunks(self, entries, result):
+        chunk, chunk_bytes = [], 0
+        for entry in entries:
+            entry_bytes = self._entry_size(entry)
+            if entry_bytes > KINESIS_MAX_BYTES_PER_RECORD:
+                logger.error(
+                    "Dropping Kinesis record of %d bytes for key %s",
+                    entry_bytes,
+                    entry["PartitionKey"],
+                )
+                result["dropped"] += 1
+                continue
+
+            if chunk and (
+                len(chunk) == KINESIS_MAX_RECORDS_PER_CALL
+                or chunk_bytes + entry_bytes > KINESIS_MAX_BYTES_PER_CALL
+            ):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+
+            chunk.append(entry)
+            chunk_bytes += entry_bytes
+
+        if chunk:
+            yield chunk
+
+    def _put_chunk(self, chunk, result):
+        pending = chunk
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                result["retried"] += len(pending)
+                self.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+            try:
+                response = self.kinesis_client.put_records(
+                    StreamName=self.prediction_stream_name, Records=pending
+                )
+            except Exception as e:
+                logger.warning("PutRecords call failed: %s", e)
+                continue
+
+            failed = [
+                entry
+                for entry, entry_result in zip(pending, response["Records"])
+                if "ErrorCode" in entry_result
+            ]
+            result["delivered"] += len(pending) - len(failed)
+            if not failed:
+                return
+            pending = failed
+
+        logger.error(
+            "Dropping %d Kinesis records after %d retries",
+            len(pending),
+            self.max_retries,
+        )
+        result["dropped"] += len(pending)
+
+
+def create_prediction_cache():
+    cache_size = int(os.getenv("PREDICTION_CACHE_SIZE") or 0)
+    if cache_size <= 0:
+        return None
+
+    cache_ttl = os.getenv("PREDICTION_CACHE_TTL")
+    cache_ttl = float(cache_ttl) if cache_ttl else None
+    logger.info(
+        "Creating prediction cache with size %d and TTL %s", cache_size, cache_ttl
+    )
+    return PredictionCache(maxsize=cache_size, ttl=cache_ttl)
+
+
+def create_metrics():
+    if os.getenv("SERVING_METRICS", "False") != "True":
+        return None
+    return StageMetrics()
+
+
+def create_payload_logger():
+    return PayloadLogger(
+        logger,
+        sample_rate=float(os.getenv("PAYLOAD_LOG_SAMPLE_RATE") or 0),
+        max_chars=int(os.getenv("PAYLOAD_LOG_MAX_CHARS") or 1000),
+    )
+
+
+def create_callback_dispatcher(callbacks):
+    if not callbacks or os.getenv("ASYNC_CALLBACKS", "False") != "True":
+        return callbacks
+
+    put_timeout = os.getenv("CALLBACK_PUT_TIMEOUT")
+    dispatcher = CallbackDispatcher(
+        callbacks,
+        max_queue_size=int(os.getenv("CALLBACK_QUEUE_SIZE") or 1000),
+        workers=int(os.getenv("CALLBACK_WORKERS") or 2),
+        policy=os.getenv("CALLBACK_QUEUE_POLICY") or "block",
+        put_timeout=float(put_timeout) if put_timeout else None,
+    )
+    logger.info("Callbacks dispatched asynchronously with policy %s", dispatcher.policy)
+    return [dispatcher]
+
+
+def create_micro_batcher(model_service):
+    if os.getenv("MICRO_BATCH", "False") != "True":
+        return None
+
+    batcher = MicroBatcher(
+        model_service.predict_records,
+        max_batch_size=int(os.getenv("MICRO_BATCH_MAX_SIZE") or 64),
+        max_wait_seconds=float(os.getenv("MICRO_BATCH_MAX_WAIT_MS") or 2) / 1000,
+    )
+    logger.info(
+        "Micro-batching up to %d records for %s seconds",
+        batcher.max_batch_size,
+        batcher.max_wait_seconds,
+    )
+    return batcher
+
+
+def compile_model_if_enabled(model, feature_columns=None):
+    if os.getenv("COMPILE_TREES", "False") != "True":
+        return model
+
+    float32_thresholds = os.getenv("COMPILE_TREES_FLOAT32", "False") == "True"
+    try:
+        compiled_model = compile_tree_model(
+            unwrap_model(model),
+            feature_columns=feature_columns or FEATURE_COLUMNS,
+            float32_thresholds=float32_thresholds,
+        )
+    except TypeError as e:
+        logger.warning("Serving the original model, it cannot be compiled: %s", e)
+        return model
+
+    logger.info(
+        "Model compiled into %d trees (%d bytes)",
+        compiled_model.n_trees,
+        compiled_model.nbytes,
+    )
+    return compiled_model
+
+
+def registry_source(model_name, stage="Production", tracking_uri=None):
+    from mlflow import MlflowClient  # pylint: disable=import-outside-toplevel
+
+    client = MlflowClient(tracking_uri=tracking_uri)
+
+    def latest_version():
+        versions = client.get_latest_versions(model_name, stages=[stage])
+        if not versions:
+            return None
+        version = max(versions, key=lambda version: int(version.version))
+        # The services use the run id as their model version.
+        return {
+            "model_version": version.run_id,
+            "run_id": version.run_id,
+            "registry_version": version.version,
+        }
+
+    return latest_version
+
+
+def file_source(path):
+    # Local stand-in for the registry: a JSON file such as
+    # {"model_version": "...", "run_id": "..."} or
+    # {"model_version": "...", "bundle_path": "..."}
+    def read_target():
+        try:
+            with open(path, "rt", encoding="utf-8") as f_in:
+                return json.load(f_in)
+        except FileNotFoundError:
+            return None
+
+    return read_target
+
+
+def load_target_model(target):
+    if target.get("bundle_path"):
+        bundle = read_serving_bundle(target["bundle_path"])
+        plan = bundle["plan"]
+        model, scaler = bundle["estimator"], None
+    else:
+        model, scaler = load_models(need_scaler=True, run_id=target["run_id"])
+        plan = PreprocessingPlan.from_scaler(scaler)
+
+    model = compile_model_if_enabled(model, plan.feature_columns)
+    return model, scaler, plan
+
+
+class ModelWatcher:  # pylint: disable=too-many-instance-attributes
+    """Polls a model source and hot-swaps new versions into a ModelService.
+
+    source() returns the target to serve as a dict with a model_version, or
+    None. A new target is loaded and warmed up on the watcher thread; only a
+    model that predicts finite values on the warm-up records is swapped in.
+    A target that failed is not retried until the source changes.
+    """
+
+    def __init__(
+        self,
+        model_service,
+        source,
+        *,
+        interval=30.0,
+        loader=load_target_model,
+        warmup_records=None,
+    ):
+        self.model_service = model_service
+        self.source = source
+        self.interval = interval
+        self.loader = loader
+        self.warmup_records = warmup_records
+        self.previous_state = None
+        self.failed_target = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="model-watcher", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("Model watcher poll failed: %s", e, exc_info=True)
+
+    def poll(self):
+        target = self.source()
+        if not target or target == self.failed_target:
+            return False
+        if target["model_version"] == self.model_service.model_version:
+            return False
+
+        logger.info("New model version %s found", target["model_version"])
+        try:
+            model, scaler, plan = self.loader(target)
+            self.warm_up(model, plan)
+        except Exception as e:
+            logger.error(
+                "Keeping model version %s, version %s failed to load: %s",
+                self.model_service.model_version,
+                target["model_version"],
+                e,
+                exc_info=True,
+            )
+            self.failed_target = target
+            return False
+
+        self.previous_state = self.model_service.swap(
+            model, scaler, target["model_version"], plan=plan
+        )
+        return True
+
+    def warm_up(self, model, plan):
+        records = self.warmup_records or [{col: 0.0 for col in plan.feature_columns}]
+        candidate = ModelService(model, None, plan=plan)
+        predictions = candidate.predict_array(candidate.preprocess_array(records))
+        if len(predictions) != len(records) or not np.isfinite(predictions).all():
+            raise ValueError(f"Warm-up predictions are not valid: {predictions}")
+
+    def rollback(self):
+        if self.previous_state is None:
+            return False
+        self.model_service.restore(self.previous_state)
+        self.previous_state = None
+        return True
+
+
+def create_model_watcher(model_service):
+    watch_file = os.getenv("MODEL_WATCH_FILE")
+    registry_name = os.getenv("MODEL_WATCH_REGISTRY_NAME")
+
+    if watch_file:
+        source = file_source(watch_file)
+    elif registry_name:
+        source = registry_source(
+            registry_name,
+            stage=os.getenv("MODEL_WATCH_STAGE") or "Production",
+            tracking_uri=os.getenv("MLFLOW_TRACKING_URI") or None,
+        )
+    else:
+        return None
+
+    interval = float(os.getenv("MODEL_WATCH_INTERVAL") or 30)
+    logger.info("Watching for new model versions every %s seconds", interval)
+    return ModelWatcher(model_service, source, interval=interval).start()
+
+
 def create_kinesis_client():
+    import boto3  # pylint: disable=import-outside-toplevel
+
     endpoint_url = os.getenv("KINESIS_ENDPOINT_URL")
     if endpoint_url is None:
         logger.info("Creating Kinesis client with default endpoint")
@@ -200,7 +944,14 @@ def create_kinesis_client():
 
 
 def init_model_service_with_kinesis(
-    prediction_stream_name: str, run_id: str, test_run: bool
+    prediction_stream_name: str,
+    run_id: str,
+    test_run: bool,
+    *,
+    batch_records: bool = False,
+    bundle_path: str = None,
+    buffer_predictions: bool = False,
+    report_batch_item_failures: bool = False,
 ):
     logger.info("Initializing model service with run ID: %s", run_id)
     callbacks = []
@@ -208,24 +959,103 @@ def init_model_service_with_kinesis(
     if not test_run:
         logger.info("Non-test run detected, setting up Kinesis callback")
         kinesis_client = create_kinesis_client()
-        kinesis_callback = KinesisCallback(kinesis_client, prediction_stream_name)
-        callbacks.append(kinesis_callback.put_record)
+        if buffer_predictions:
+            callbacks.append(
+                BufferedKinesisCallback(kinesis_client, prediction_stream_name)
+            )
+        else:
+            kinesis_callback = KinesisCallback(kinesis_client, prediction_stream_name)
+            callbacks.append(kinesis_callback.put_record)
+
+    if bundle_path:
+        return init_model_service_from_bundle(
+            bundle_path,
+            model_version=run_id,
+            callbacks=callbacks,
+            batch_records=batch_records,
+            report_batch_item_failures=report_batch_item_failures,
+        )
 
     model_service = init_model_service(
-        model_version=run_id, callbacks=callbacks, need_scaler=True
+        model_version=run_id,
+        callbacks=callbacks,
+        need_scaler=True,
+        batch_records=batch_records,
+        report_batch_item_failures=report_batch_item_failures,
     )
 
     return model_service
 
 
-def init_model_service(model_version=None, callbacks=None, need_scaler=False):
+def init_model_service(
+    model_version=None,
+    callbacks=None,
+    need_scaler=False,
+    batch_records=False,
+    *,
+    report_batch_item_failures=False,
+):
 
     model, scaler = load_models(need_scaler)
     logger.info("Models loaded successfully")
+    model = compile_model_if_enabled(model)
 
     model_service = ModelService(
-        model=model, scaler=scaler, model_version=model_version, callbacks=callbacks
+        model=model,
+        scaler=scaler,
+        model_version=model_version,
+        callbacks=create_callback_dispatcher(callbacks),
+        batch_records=batch_records,
+        cache=create_prediction_cache(),
+        metrics=create_metrics(),
+        payload_logger=create_payload_logger(),
+        report_batch_item_failures=report_batch_item_failures,
     )
     logger.info("Model service initialized with version: %s", model_version)
 
     return model_service
+
+
+def init_model_service_from_bundle(
+    bundle_path,
+    model_version=None,
+    callbacks=None,
+    batch_records=False,
+    warmup=True,
+    *,
+    report_batch_item_failures=False,
+):
+    bundle = read_serving_bundle(bundle_path)
+    logger.info("Serving bundle loaded from %s", bundle_path)
+
+    model_service = ModelService(
+        model=compile_model_if_enabled(
+            bundle["estimator"], bundle["plan"].feature_columns
+        ),
+        scaler=None,
+        model_version=model_version or bundle["model_version"],
+        callbacks=create_callback_dispatcher(callbacks),
+        batch_records=batch_records,
+        cache=create_prediction_cache(),
+        plan=bundle["plan"],
+        metrics=create_metrics(),
+        payload_logger=create_payload_logger(),
+        report_batch_item_failures=report_batch_item_failures,
+    )
+
+    if warmup:
+        warmup_record = {col: 0.0 for col in model_service.plan.feature_columns}
+        model_service.predict_array(model_service.preprocess_array(warmup_record))
+        logger.info("Warm-up prediction done")
+
+    return model_service
+
+
+def export_serving_bundle(output_dir, model_version):
+    model, scaler = load_models(need_scaler=True)
+    bundle_path = os.path.join(output_dir, bundle_filename(model_version))
+    write_serving_bundle(
+        bundle_path, model, PreprocessingPlan.from_scaler(scaler), model_version
+    )
+    logger.info("Serving bundle saved to %s", bundle_path)
+    return bundle_path
@@ -0,0 +1,61 @@
+import random
+import logging
+
+
+class _Payload:
+    # Formatted by the logging handler, so only records that are actually
+    # emitted pay for repr() and truncation.
+    __slots__ = ("payload", "max_chars", "text")
+
+    def __init__(self, payload, max_chars):
+        self.payload = payload
+        self.max_chars = max_chars
+        self.text = None
+
+    def __str__(self):
+        # Every handler formats the record, the payload is rendered once.
+        if self.text is None:
+            text = repr(self.payload)
+            if self.max_chars is not None and len(text) > self.max_chars:
+                text = f"{text[:self.max_chars]}... ({len(text)} chars)"
+            self.text = text
+        return self.text
+
+
+class PayloadLogger:
+    """Logs request payloads for a sampled fraction of the calls.
+
+    Disabled with sample_rate=0 (the default). Payloads are truncated to
+    max_chars and formatted lazily, when the log record is emitted.
+    """
+
+    def __init__(
+        self,
+        logger,
+        *,
+        sample_rate=0.0,
+        max_chars=1000,
+        level=logging.INFO,
+        rng=random.random,
+    ):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.max_chars = max_chars
+        self.level = level
+        self.rng = rng
+
+    def sampled(self):
+        if self.sample_rate <= 0:
+            return False
+        if self.sample_rate < 1 and self.rng() >= self.sample_rate:
+            return False
+        return self.logger.isEnabledFor(self.level)
+
+    def emit(self, message, payload):
+        self.logger.log(
+            self.level, "%s: %s", message, _Payload(payload, self.max_chars)
+        )
+
+    def log(self, message, payload):
+        if self.sampled():
+            self.emit(message, payload)
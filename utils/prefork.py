@@ -0,0 +1,183 @@
+import gc
+import os
+import mmap
+import random
+import signal
+import socket
+import logging
+import threading
+
+import numpy as np
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+
+def share_array(array):
+    # Anonymous mmaps are MAP_SHARED, so after a fork every worker maps the
+    # same physical pages instead of copying them on the first write nearby.
+    buffer = mmap.mmap(-1, max(array.nbytes, 1))
+    shared = np.frombuffer(buffer, dtype=array.dtype, count=array.size)
+    shared = shared.reshape(array.shape)
+    shared[...] = array
+    shared.flags.writeable = False
+    return shared
+
+
+def share_arrays(obj, min_bytes=0):
+    shared_bytes = 0
+    for name, value in list(vars(obj).items()):
+        if (
+            isinstance(value, np.ndarray)
+            and not value.dtype.hasobject
+            and value.nbytes >= min_bytes
+        ):
+            setattr(obj, name, share_array(value))
+            shared_bytes += value.nbytes
+    return shared_bytes
+
+
+class _RequestLimit:
+    def __init__(self, app, max_requests):
+        self.app = app
+        self.max_requests = max_requests
+        self.server = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        try:
+            return self.app(environ, start_response)
+        finally:
+            with self._lock:
+                self._count += 1
+                limit_reached = self._count == self.max_requests
+            if limit_reached:
+                logger.info(
+                    "Worker %d served %d requests, recycling",
+                    os.getpid(),
+                    self._count,
+                )
+                # shutdown() waits for serve_forever, so it cannot run on
+                # the thread that is serving this request.
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+
+class PreforkServer:  # pylint: disable=too-many-instance-attributes
+    """Pre-forking WSGI server for an app that is already loaded.
+
+    The master binds the socket, freezes the objects it has created so the
+    garbage collector does not dirty their pages, and forks the workers,
+    which share the model memory copy-on-write and accept connections on the
+    inherited socket. A worker that has served max_requests requests (plus
+    a random jitter) exits and the master forks a fresh one.
+    """
+
+    def __init__(
+        self,
+        app,
+        *,
+        host="0.0.0.0",
+        port=9696,
+        workers=None,
+        max_requests=0,
+        max_requests_jitter=0,
+        threaded=False,
+        post_fork=None,
+    ):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("PreforkServer needs os.fork, which is POSIX only")
+        self.app = app
+        self.host, self.port = host, port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.threaded = threaded
+        self.post_fork = post_fork
+        self.socket = None
+        self.running = False
+        self.worker_pids = set()
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=2048)
+        self.port = self.socket.getsockname()[1]
+        logger.info(
+            "Serving on %s:%d with %d workers", self.host, self.port, self.workers
+        )
+
+        gc.collect()
+        gc.freeze()
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for _ in range(self.workers):
+            self._spawn()
+
+        while self.worker_pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.worker_pids.discard(pid)
+            if self.running:
+                logger.info(
+                    "Worker %d exited with status %d, forking a new one",
+                    pid,
+                    os.waitstatus_to_exitcode(status),
+                )
+                self._spawn()
+
+        self.socket.close()
+
+    def stop(self, *_):
+        self.running = False
+        for pid in list(self.worker_pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.worker_pids.discard(pid)
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.worker_pids.add(pid)
+            return
+
+        exit_code = 1
+        try:
+            self._run_worker()
+            exit_code = 0
+        except Exception as e:
+            logger.error("Worker %d crashed: %s", os.getpid(), e, exc_info=True)
+        finally:
+            os._exit(exit_code)
+
+    def _run_worker(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        random.seed()
+
+        if self.post_fork is not None:
+            self.post_fork()
+
+        app = self.app
+        if self.max_requests:
+            app = _RequestLimit(
+                app, self.max_requests + random.randint(0, self.max_requests_jitter)
+            )
+
+        server = make_server(
+            self.host, self.port, app, threaded=self.threaded, fd=self.socket.fileno()
+        )
+        # Join the request threads on shutdown so in-flight requests finish.
+        server.daemon_threads = False
+        if isinstance(app, _RequestLimit):
+            app.server = server
+
+        signal.signal(
+            signal.SIGTERM,
+            lambda *_: threading.Thread(target=server.shutdown, daemon=True).start(),
+        )
+        server.serve_forever()
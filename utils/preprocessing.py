@@ -0,0 +1,130 @@
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+MINMAX_COLUMNS = [
+    "ParentalEducation",
+    "StudyTimeWeekly",
+    "Absences",
+    "ParentalSupport",
+]
+
+DROPPED_COLUMNS = ["StudentID", "Age", "Gender", "Ethnicity"]
+
+FEATURE_COLUMNS = [
+    "ParentalEducation",
+    "StudyTimeWeekly",
+    "Absences",
+    "Tutoring",
+    "ParentalSupport",
+    "Extracurricular",
+    "Sports",
+    "Music",
+    "Volunteering",
+]
+
+
+class PreprocessingPlan:
+    """Raw student records to the model feature matrix in a single pass.
+
+    The scaling parameters and the column positions are resolved once, so
+    every call only fills a float64 array in FEATURE_COLUMNS order and scales
+    the MinMax columns in place.
+    """
+
+    def __init__(
+        self,
+        scale=None,
+        offset=None,
+        clip_range=None,
+        *,
+        scaler=None,
+        feature_columns=None,
+        minmax_columns=None,
+    ):
+        self.feature_columns = list(feature_columns or FEATURE_COLUMNS)
+        self.minmax_columns = list(minmax_columns or MINMAX_COLUMNS)
+        self.minmax_index = np.array(
+            [self.feature_columns.index(col) for col in self.minmax_columns]
+        )
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+        self.offset = None if offset is None else np.asarray(offset, dtype=np.float64)
+        self.clip_range = clip_range
+        self.scaler = scaler
+
+    @classmethod
+    def from_scaler(cls, scaler, feature_columns=None, minmax_columns=None):
+        # A fitted MinMaxScaler transforms as X * scale_ + min_, which we replay
+        # with the same operations so the output is bit-identical. Any other
+        # scaler keeps going through its own transform.
+        if hasattr(scaler, "scale_") and hasattr(scaler, "min_"):
+            clip_range = (
+                scaler.feature_range if getattr(scaler, "clip", False) else None
+            )
+            return cls(
+                scale=scaler.scale_,
+                offset=scaler.min_,
+                clip_range=clip_range,
+                feature_columns=feature_columns,
+                minmax_columns=minmax_columns,
+            )
+        return cls(
+            scaler=scaler,
+            feature_columns=feature_columns,
+            minmax_columns=minmax_columns,
+        )
+
+    def to_array(self, raw_data, copy=True):
+        if isinstance(raw_data, pd.DataFrame):
+            features = np.empty(
+                (len(raw_data), len(self.feature_columns)), dtype=np.float64
+            )
+            for position, col in enumerate(self.feature_columns):
+                features[:, position] = raw_data[col].to_numpy()
+            return features
+
+        # Feature rows already in feature_columns order (see utils.validation).
+        # They are scaled in place, so they are copied unless the caller owns
+        # them and passes copy=False.
+        if isinstance(raw_data, np.ndarray):
+            features = (
+                np.array(raw_data, dtype=np.float64)
+                if copy
+                else np.asarray(raw_data, dtype=np.float64)
+            )
+            return features.reshape(-1, len(self.feature_columns))
+
+        if isinstance(raw_data, Mapping):
+            raw_data = [raw_data]
+        elif raw_data and isinstance(raw_data[0], np.ndarray):
+            return np.vstack(raw_data).astype(np.float64, copy=False)
+
+        return np.array(
+            [[record[col] for col in self.feature_columns] for record in raw_data],
+            dtype=np.float64,
+            ndmin=2,
+        ).reshape(-1, len(self.feature_columns))
+
+    def scale_array(self, features):
+        if self.scale is None:
+            features[:, self.minmax_index] = self.scaler.transform(
+                features[:, self.minmax_index]
+            )
+            return features
+
+        x_sc = features[:, self.minmax_index]
+        x_sc *= self.scale
+        x_sc += self.offset
+        if self.clip_range is not None:
+            np.clip(x_sc, self.clip_range[0], self.clip_range[1], out=x_sc)
+        features[:, self.minmax_index] = x_sc
+        return features
+
+    def transform(self, raw_data, copy=True):
+        return self.scale_array(self.to_array(raw_data, copy))
+
+    def to_frame(self, features, index=None):
+        return pd.DataFrame(
+            features, columns=self.feature_columns, index=index, copy=False
+        )
@@ -0,0 +1,77 @@
+import os
+import time
+import pickle
+
+import numpy as np
+
+from utils.preprocessing import DROPPED_COLUMNS, PreprocessingPlan
+
+BUNDLE_FORMAT_VERSION = 1
+
+
+def unwrap_model(model):
+    # mlflow pyfunc models hide the fitted estimator behind a wrapper. Models
+    # loaded from MODEL_LOCATION are already the raw estimator.
+    get_raw_model = getattr(model, "get_raw_model", None)
+    if callable(get_raw_model):
+        return get_raw_model()
+
+    model_impl = getattr(model, "_model_impl", None)
+    if model_impl is not None:
+        return getattr(model_impl, "sklearn_model", model_impl)
+
+    return model
+
+
+def bundle_filename(model_version):
+    return f"student-performance-{model_version}.bundle"
+
+
+def write_serving_bundle(path, model, plan, model_version=None):
+    if plan.scale is None:
+        raise ValueError("Serving bundles need a fitted MinMaxScaler")
+
+    bundle = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "model_version": model_version,
+        "created_at": time.time(),
+        "estimator": unwrap_model(model),
+        "scaler": {
+            "scale": plan.scale,
+            "offset": plan.offset,
+            "clip_range": plan.clip_range,
+        },
+        "feature_columns": plan.feature_columns,
+        "minmax_columns": plan.minmax_columns,
+        "dropped_columns": DROPPED_COLUMNS,
+    }
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f_out:
+        pickle.dump(bundle, f_out, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def read_serving_bundle(path):
+    with open(path, "rb") as f_in:
+        bundle = pickle.load(f_in)
+
+    format_version = bundle.get("format_version")
+    if format_version != BUNDLE_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported serving bundle format {format_version} in {path}, "
+            f"expected {BUNDLE_FORMAT_VERSION}"
+        )
+
+    scaler = bundle["scaler"]
+    bundle["plan"] = PreprocessingPlan(
+        scale=np.asarray(scaler["scale"]),
+        offset=np.asarray(scaler["offset"]),
+        clip_range=scaler["clip_range"],
+        feature_columns=bundle["feature_columns"],
+        minmax_columns=bundle["minmax_columns"],
+    )
+
+    return bundle
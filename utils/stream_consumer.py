@@ -0,0 +1,414 @@
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def kinesis_record(shard_id, sequence_number, partition_key, data, arrival):
+    # Same shape as the records of a Kinesis event delivered to Lambda.
+    return {
+        "kinesis": {
+            "kinesisSchemaVersion": "1.0",
+            "partitionKey": partition_key,
+            "sequenceNumber": sequence_number,
+            "data": base64.b64encode(data).decode("utf-8"),
+            "approximateArrivalTimestamp": arrival,
+        },
+        "eventSource": "aws:kinesis",
+        "eventName": "aws:kinesis:record",
+        "eventID": f"{shard_id}:{sequence_number}",
+    }
+
+
+class KinesisShardReader:
+    def __init__(
+        self,
+        kinesis_client,
+        stream_name,
+        shard_id,
+        *,
+        after_sequence_number=None,
+        iterator_type="TRIM_HORIZON",
+    ):
+        self.kinesis_client = kinesis_client
+        self.shard_id = shard_id
+        self.closed = False
+        if after_sequence_number is None:
+            response = kinesis_client.get_shard_iterator(
+                StreamName=stream_name,
+                ShardId=shard_id,
+                ShardIteratorType=iterator_type,
+            )
+        else:
+            response = kinesis_client.get_shard_iterator(
+                StreamName=stream_name,
+                ShardId=shard_id,
+                ShardIteratorType="AFTER_SEQUENCE_NUMBER",
+                StartingSequenceNumber=after_sequence_number,
+            )
+        self.iterator = response["ShardIterator"]
+
+    def read(self, limit):
+        # Returns the next records and how many milliseconds the iterator is
+        # behind the tip of the shard.
+        try:
+            response = self.kinesis_client.get_records(
+                ShardIterator=self.iterator, Limit=limit
+            )
+        except self.kinesis_client.exceptions.ProvisionedThroughputExceededException:
+            logger.warning("Read throughput exceeded on shard %s", self.shard_id)
+            return [], None
+
+        self.iterator = response.get("NextShardIterator")
+        self.closed = self.iterator is None
+        records = [
+            kinesis_record(
+                self.shard_id,
+                record["SequenceNumber"],
+                record["PartitionKey"],
+                record["Data"],
+                record["ApproximateArrivalTimestamp"].timestamp(),
+            )
+            for record in response["Records"]
+        ]
+        return records, response.get("MillisBehindLatest", 0)
+
+
+class FileShardReader:
+    # Follows an append-only JSON lines file, one record per line. The
+    # sequence number of a record is its line number.
+    closed = False
+
+    def __init__(self, path, shard_id, *, after_sequence_number=None):
+        self.shard_id = shard_id
+        self.sequence_number = 0
+        # Kept open to follow the file, closed by close().
+        # pylint: disable-next=consider-using-with
+        self._file = open(path, "rt", encoding="utf-8")
+        if after_sequence_number is not None:
+            while self.sequence_number < int(after_sequence_number):
+                if not self._readline():
+                    break
+
+    def _readline(self):
+        position = self._file.tell()
+        line = self._file.readline()
+        if not line.endswith("\n"):
+            # Nothing new, or a line that is still being written.
+            self._file.seek(position)
+            return None
+        self.sequence_number += 1
+        return line
+
+    def read(self, limit):
+        records = []
+        while len(records) < limit:
+            line = self._readline()
+            if line is None:
+                break
+            entry = json.loads(line)
+            records.append(
+                kinesis_record(
+                    self.shard_id,
+                    str(self.sequence_number),
+                    entry["partitionKey"],
+                    entry["data"].encode("utf-8"),
+                    entry["arrival"],
+                )
+            )
+
+        # Without an index of the file, the lag is the age of the newest
+        # record read while a full batch suggests that more are waiting.
+        if len(records) < limit:
+            return records, 0
+        arrival = records[-1]["kinesis"]["approximateArrivalTimestamp"]
+        return records, (time.time() - arrival) * 1000
+
+    def close(self):
+        self._file.close()
+
+
+class FileStream:
+    """File-backed local stand-in for a Kinesis stream.
+
+    Every shard is a <shard_id>.jsonl file in directory. Records are routed
+    to shards by the MD5 hash of their partition key, like in Kinesis.
+    """
+
+    def __init__(self, directory, shards=1):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        if not self.shard_ids():
+            for shard in range(shards):
+                with open(self.path(f"shardId-{shard:012d}"), "at", encoding="utf-8"):
+                    pass
+
+    def path(self, shard_id):
+        return os.path.join(self.directory, f"{shard_id}.jsonl")
+
+    def shard_ids(self):
+        return sorted(
+            name[: -len(".jsonl")]
+            for name in os.listdir(self.directory)
+            if name.endswith(".jsonl")
+        )
+
+    def reader(self, shard_id, after_sequence_number=None):
+        return FileShardReader(
+            self.path(shard_id), shard_id, after_sequence_number=after_sequence_number
+        )
+
+    def put_records(self, records):
+        # records are (partition_key, data) pairs, data being a str.
+        shard_ids = self.shard_ids()
+        lines = {shard_id: [] for shard_id in shard_ids}
+        arrival = time.time()
+        for partition_key, data in records:
+            key_hash = int(hashlib.md5(partition_key.encode("utf-8")).hexdigest(), 16)
+            lines[shard_ids[key_hash % len(shard_ids)]].append(
+                json.dumps(
+                    {"partitionKey": partition_key, "data": data, "arrival": arrival}
+                )
+                + "\n"
+            )
+        for shard_id, shard_lines in lines.items():
+            with open(self.path(shard_id), "at", encoding="utf-8") as f_out:
+                f_out.writelines(shard_lines)
+
+
+class CheckpointStore:
+    """Last processed sequence number of every shard, in a JSON file.
+
+    Without a path the checkpoints are only kept in memory.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checkpoints = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "rt", encoding="utf-8") as f_in:
+                self._checkpoints = json.load(f_in)
+
+    def get(self, shard_id):
+        return self._checkpoints.get(shard_id)
+
+    def save(self, shard_id, sequence_number):
+        with self._lock:
+            self._checkpoints[shard_id] = sequence_number
+            if self.path is None:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wt", encoding="utf-8") as f_out:
+                json.dump(self._checkpoints, f_out)
+            os.replace(tmp_path, self.path)
+
+
+def first_failure(batch, result):
+    # Index of the first record to retry, None when the batch succeeded.
+    failures = result.get("batchItemFailures") if isinstance(result, dict) else None
+    if not failures:
+        return None
+    failed = {failure["itemIdentifier"] for failure in failures}
+    for i, record in enumerate(batch):
+        if record["kinesis"]["sequenceNumber"] in failed:
+            return i
+    return 0
+
+
+class ShardConsumer(threading.Thread):  # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        reader,
+        handler,
+        checkpoints,
+        *,
+        batch_size=100,
+        window_seconds=1.0,
+        max_retries=3,
+        poll_interval=0.2,
+        stop_when_idle=False,
+    ):
+        super().__init__(name=f"consumer-{reader.shard_id}", daemon=True)
+        self.reader = reader
+        self.handler = handler
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.window_seconds = window_seconds
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.stop_when_idle = stop_when_idle
+        self.stats = {
+            "records": 0,
+            "batches": 0,
+            "retries": 0,
+            "skipped": 0,
+            "lag_ms": 0,
+        }
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def read(self, limit):
+        records, lag_ms = self.reader.read(limit)
+        if lag_ms is not None:
+            self.stats["lag_ms"] = lag_ms
+        return records, lag_ms
+
+    def next_batch(self):
+        # Up to batch_size records, or whatever arrived within window_seconds
+        # of the first one.
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size and not self._stop_event.is_set():
+            records, lag_ms = self.read(self.batch_size - len(batch))
+            batch.extend(records)
+            if len(batch) >= self.batch_size or self.reader.closed:
+                break
+            if records and lag_ms:
+                # Behind the tip of the shard, read on without waiting.
+                continue
+            if not records and self.stop_when_idle:
+                break
+            if batch and deadline is None:
+                deadline = time.monotonic() + self.window_seconds
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self._stop_event.wait(self.poll_interval)
+        return batch
+
+    def process(self, batch):
+        attempt = 0
+        while batch:
+            raised = False
+            try:
+                failed = first_failure(batch, self.handler({"Records": batch}))
+            except Exception as e:
+                logger.error("Handler failed on shard %s: %s", self.reader.shard_id, e)
+                failed, raised = 0, True
+            if failed is None:
+                failed = len(batch)
+            if failed:
+                self.stats["records"] += failed
+                self.checkpoint(batch[failed - 1])
+                batch = batch[failed:]
+                attempt = 0
+                continue
+
+            attempt += 1
+            if attempt <= self.max_retries:
+                self.stats["retries"] += 1
+                self._stop_event.wait(self.poll_interval * attempt)
+                continue
+            # Give up on the failed record (the whole batch when the handler
+            # raised), so it does not stall the shard.
+            skipped = len(batch) if raised else 1
+            logger.error(
+                "Skipping %d records of shard %s from %s after %d retries",
+                skipped,
+                self.reader.shard_id,
+                batch[0]["kinesis"]["sequenceNumber"],
+                self.max_retries,
+            )
+            self.stats["skipped"] += skipped
+            self.checkpoint(batch[skipped - 1])
+            batch = batch[skipped:]
+            attempt = 0
+
+    def checkpoint(self, record):
+        self.checkpoints.save(self.reader.shard_id, record["kinesis"]["sequenceNumber"])
+
+    def run(self):
+        while not self._stop_event.is_set():
+            batch = self.next_batch()
+            if batch:
+                self.stats["batches"] += 1
+                self.process(batch)
+            elif self.reader.closed or self.stop_when_idle:
+                break
+        close = getattr(self.reader, "close", None)
+        if close is not None:
+            close()
+        logger.info("Consumer of shard %s stopped", self.reader.shard_id)
+
+
+class StreamConsumer:
+    """Reads the shards of a stream in parallel and calls a Lambda handler.
+
+    Every shard is read by its own thread, which builds batches of up to
+    batch_size records (or what arrived within window_seconds), calls
+    handler with a Kinesis event and checkpoints the shard. Records returned
+    in batchItemFailures are retried like Lambda does, and skipped after
+    max_retries.
+    """
+
+    def __init__(self, readers, handler, checkpoints=None, **options):
+        self.checkpoints = checkpoints or CheckpointStore()
+        self.consumers = [
+            ShardConsumer(reader, handler, self.checkpoints, **options)
+            for reader in readers
+        ]
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for consumer in self.consumers:
+            consumer.start()
+        return self
+
+    def stop(self):
+        for consumer in self.consumers:
+            consumer.stop()
+
+    def join(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for consumer in self.consumers:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            consumer.join(remaining)
+
+    def running(self):
+        return any(consumer.is_alive() for consumer in self.consumers)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        shards = {
+            consumer.reader.shard_id: dict(consumer.stats)
+            for consumer in self.consumers
+        }
+        records = sum(stats["records"] for stats in shards.values())
+        return {
+            "elapsed_seconds": elapsed,
+            "records": records,
+            "records_per_second": records / elapsed if elapsed else 0.0,
+            "max_lag_ms": max(
+                (stats["lag_ms"] for stats in shards.values()), default=0
+            ),
+            "shards": shards,
+        }
+
+
+def kinesis_readers(kinesis_client, stream_name, checkpoints, iterator_type):
+    shards = kinesis_client.list_shards(StreamName=stream_name)["Shards"]
+    return [
+        KinesisShardReader(
+            kinesis_client,
+            stream_name,
+            shard["ShardId"],
+            after_sequence_number=checkpoints.get(shard["ShardId"]),
+            iterator_type=iterator_type,
+        )
+        for shard in shards
+    ]
+
+
+def file_readers(file_stream, checkpoints):
+    return [
+        file_stream.reader(shard_id, checkpoints.get(shard_id))
+        for shard_id in file_stream.shard_ids()
+    ]
@@ -0,0 +1,70 @@
+import json
+import base64
+
+import numpy as np
+import pandas as pd
+
+# Raw input fields of a student record, as sent to the serving endpoints.
+# kind is "int" (uniform integers in [low, high]) or "float" (uniform in
+# [low, high)). StudentID is an identifier and is generated sequentially.
+STUDENT_SCHEMA = {
+    "StudentID": ("int", 1001, 3392),
+    "Age": ("int", 15, 18),
+    "Gender": ("int", 0, 1),
+    "Ethnicity": ("int", 0, 3),
+    "ParentalEducation": ("int", 0, 4),
+    "StudyTimeWeekly": ("float", 0.0, 20.0),
+    "Absences": ("int", 0, 29),
+    "Tutoring": ("int", 0, 1),
+    "ParentalSupport": ("int", 0, 4),
+    "Extracurricular": ("int", 0, 1),
+    "Sports": ("int", 0, 1),
+    "Music": ("int", 0, 1),
+    "Volunteering": ("int", 0, 1),
+}
+
+STUDENT_FIELDS = list(STUDENT_SCHEMA)
+
+
+def generate_students(n, seed=42, first_id=None):
+    """Synthetic raw student records following STUDENT_SCHEMA.
+
+    Returns a float64 DataFrame with one column per field, like the records
+    decoded from the JSON payloads.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for field, (kind, low, high) in STUDENT_SCHEMA.items():
+        if field == "StudentID":
+            start = low if first_id is None else first_id
+            columns[field] = np.arange(start, start + n, dtype=np.float64)
+        elif kind == "int":
+            columns[field] = rng.integers(low, high + 1, size=n).astype(np.float64)
+        else:
+            columns[field] = rng.uniform(low, high, size=n)
+    return pd.DataFrame(columns)
+
+
+def kinesis_event(students):
+    # Kinesis event of student records, as delivered to lambda_handler.
+    records = []
+    for student in students:
+        student_event = {"student": student, "student_id": student["StudentID"]}
+        data = base64.b64encode(json.dumps(student_event).encode("utf-8"))
+        records.append({"kinesis": {"data": data.decode("utf-8")}})
+    return {"Records": records}
+
+
+def grade_class(students, seed=42):
+    # Rough stand-in for the GradeClass target (0 = A ... 4 = F): more study
+    # time and support raise the grade, absences lower it.
+    rng = np.random.default_rng(seed)
+    score = (
+        students["StudyTimeWeekly"] / 20.0
+        - students["Absences"] / 15.0
+        + 0.1 * students["ParentalSupport"]
+        + 0.2 * students["Tutoring"]
+        + rng.normal(0.0, 0.2, size=len(students))
+    )
+    bins = np.quantile(score, [0.1, 0.25, 0.45, 0.65])
+    return 4 - np.digitize(score, bins)
@@ -0,0 +1,332 @@
+import json
+
+import numpy as np
+
+SKLEARN_FOREST_TYPES = (
+    "RandomForestClassifier",
+    "RandomForestRegressor",
+    "ExtraTreesClassifier",
+    "ExtraTreesRegressor",
+)
+SKLEARN_TREE_TYPES = (
+    "DecisionTreeClassifier",
+    "DecisionTreeRegressor",
+    "ExtraTreeClassifier",
+    "ExtraTreeRegressor",
+)
+XGBOOST_TYPES = ("XGBClassifier", "XGBRegressor")
+
+
+def _round_down_to_float32(threshold):
+    # For float32 inputs x <= t holds exactly when x <= (largest float32 <= t),
+    # so rounding towards -inf keeps the splits identical.
+    threshold_32 = threshold.astype(np.float32)
+    too_high = threshold_32.astype(np.float64) > threshold
+    threshold_32[too_high] = np.nextafter(threshold_32[too_high], np.float32(-np.inf))
+    return threshold_32
+
+
+def _tree_depth(left, right, root):
+    depth, level = 0, np.array([root])
+    while True:
+        children = np.concatenate([left[level], right[level]])
+        children = children[children != np.concatenate([level, level])]
+        if children.size == 0:
+            return depth
+        depth, level = depth + 1, children
+
+
+class CompiledTrees:  # pylint: disable=too-many-instance-attributes
+    """Tree ensemble flattened into contiguous NumPy arrays.
+
+    All trees share one node table. Leaves point to themselves and carry an
+    infinite threshold, so a fixed number of vectorized steps (the depth of
+    the deepest tree) moves every (row, tree) pair to its leaf.
+    """
+
+    accepts_array = True
+
+    def __init__(
+        self,
+        *,
+        feature,
+        threshold,
+        left,
+        right,
+        default_left,
+        leaf_value,
+        roots,
+        strict,
+        input_dtype,
+        output,
+        classes=None,
+        tree_group=None,
+        base_margin=None,
+        feature_names=None,
+    ):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.default_left = np.ascontiguousarray(default_left, dtype=bool)
+        self.leaf_value = np.ascontiguousarray(leaf_value)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.strict = strict
+        self.input_dtype = input_dtype
+        self.output = output
+        self.classes = classes
+        self.tree_group = tree_group
+        self.base_margin = base_margin
+        self.feature_names = feature_names
+        self.max_depth = max(
+            (_tree_depth(self.left, self.right, root) for root in self.roots),
+            default=0,
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(
+            array.nbytes
+            for array in (
+                self.feature,
+                self.threshold,
+                self.left,
+                self.right,
+                self.default_left,
+                self.leaf_value,
+                self.roots,
+            )
+        )
+
+    def apply(self, X):
+        X = np.asarray(X, dtype=self.input_dtype)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+        has_missing = bool(np.isnan(X).any())
+
+        for _ in range(self.max_depth):
+            values = X[rows, self.feature[nodes]]
+            if self.strict:
+                go_left = values < self.threshold[nodes]
+            else:
+                go_left = values <= self.threshold[nodes]
+            if has_missing:
+                missing = np.isnan(values)
+                go_left[missing] = self.default_left[nodes[missing]]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return nodes
+
+    def predict(self, X):
+        leaves = self.apply(X)
+
+        if self.output in ("tree_class", "tree_value"):
+            values = self.leaf_value[leaves[:, 0]]
+            if self.output == "tree_value":
+                return values[:, 0]
+            return self.classes.take(np.argmax(values, axis=1), axis=0)
+
+        if self.output in ("forest_class", "forest_value"):
+            # Same accumulation order as sklearn: tree by tree, then divide.
+            total = np.zeros((leaves.shape[0], self.leaf_value.shape[1]))
+            for tree in range(self.n_trees):
+                total += self.leaf_value[leaves[:, tree]]
+            total /= self.n_trees
+            if self.output == "forest_value":
+                return total[:, 0]
+            return self.classes.take(np.argmax(total, axis=1), axis=0)
+
+        return self._predict_xgboost(leaves)
+
+    def _predict_xgboost(self, leaves):
+        n_groups = len(self.base_margin)
+        margin = np.empty((leaves.shape[0], n_groups), dtype=np.float32)
+        margin[:] = self.base_margin
+        for tree in range(self.n_trees):
+            margin[:, self.tree_group[tree]] += self.leaf_value[leaves[:, tree], 0]
+
+        if self.output == "xgb_softprob":
+            exp_margin = np.exp(margin - margin.max(axis=1)[:, np.newaxis])
+            proba = exp_margin / exp_margin.sum(axis=1)[:, np.newaxis]
+            return np.argmax(proba, axis=1)
+        if self.output == "xgb_logistic":
+            proba = np.float32(1) / (np.float32(1) + np.exp(-margin[:, 0]))
+            return (proba > 0.5).astype(np.int64)
+        return margin[:, 0]
+
+
+def _sklearn_tree_arrays(tree, offset, float32_thresholds):
+    tree_ = tree.tree_
+    is_leaf = tree_.children_left == -1
+    node_ids = np.arange(tree_.node_count) + offset
+
+    threshold = np.where(is_leaf, np.inf, tree_.threshold)
+    if float32_thresholds:
+        threshold = _round_down_to_float32(threshold)
+
+    missing_go_to_left = getattr(tree_, "missing_go_to_left", None)
+    if missing_go_to_left is None:
+        missing_go_to_left = np.zeros(tree_.node_count, dtype=bool)
+
+    return {
+        "feature": np.where(is_leaf, 0, tree_.feature),
+        "threshold": threshold,
+        "left": np.where(is_leaf, node_ids, tree_.children_left + offset),
+        "right": np.where(is_leaf, node_ids, tree_.children_right + offset),
+        "default_left": missing_go_to_left.astype(bool),
+        "value": tree_.value[:, 0, :],
+    }
+
+
+def _concat(parts, name):
+    return np.concatenate([part[name] for part in parts])
+
+
+def _compile_sklearn(model, float32_thresholds):
+    model_type = type(model).__name__
+    is_forest = model_type in SKLEARN_FOREST_TYPES
+    trees = model.estimators_ if is_forest else [model]
+
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise TypeError("Only single-output tree models can be compiled")
+
+    parts, roots, offset = [], [], 0
+    for tree in trees:
+        part = _sklearn_tree_arrays(tree, offset, float32_thresholds)
+        parts.append(part)
+        roots.append(offset)
+        offset += len(part["feature"])
+
+    is_classifier = hasattr(model, "classes_")
+    leaf_value = _concat(parts, "value")
+    if is_classifier and is_forest:
+        # Forests average the normalised class distribution of each tree.
+        normalizer = leaf_value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        leaf_value = leaf_value / normalizer
+
+    if is_forest:
+        output = "forest_class" if is_classifier else "forest_value"
+    else:
+        output = "tree_class" if is_classifier else "tree_value"
+
+    return CompiledTrees(
+        feature=_concat(parts, "feature"),
+        threshold=_concat(parts, "threshold"),
+        left=_concat(parts, "left"),
+        right=_concat(parts, "right"),
+        default_left=_concat(parts, "default_left"),
+        leaf_value=leaf_value,
+        roots=roots,
+        strict=False,
+        input_dtype=np.float32,
+        output=output,
+        classes=getattr(model, "classes_", None),
+        feature_names=getattr(model, "feature_names_in_", None),
+    )
+
+
+def _parse_base_score(base_score):
+    values = base_score.strip("[]").split(",")
+    return np.array([float(value) for value in values], dtype=np.float32)
+
+
+def _xgboost_tree_arrays(tree, offset):
+    if any(tree["split_type"]):
+        raise TypeError("Categorical XGBoost splits are not supported")
+
+    left = np.array(tree["left_children"])
+    is_leaf = left == -1
+    node_ids = np.arange(len(left)) + offset
+    # Leaf values are stored in split_conditions.
+    conditions = np.array(tree["split_conditions"], dtype=np.float32)
+
+    return {
+        "feature": np.where(is_leaf, 0, tree["split_indices"]),
+        "threshold": np.where(is_leaf, np.float32(np.inf), conditions),
+        "left": np.where(is_leaf, node_ids, left + offset),
+        "right": np.where(is_leaf, node_ids, np.array(tree["right_children"]) + offset),
+        "default_left": np.array(tree["default_left"], dtype=bool),
+        "value": np.where(is_leaf, conditions, 0)[:, np.newaxis],
+    }
+
+
+def _compile_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    gradient_booster = learner["gradient_booster"]
+    if gradient_booster["name"] != "gbtree":
+        raise TypeError(f"Unsupported XGBoost booster {gradient_booster['name']}")
+    if getattr(model, "best_iteration", None) is not None:
+        raise TypeError("XGBoost models with early stopping are not supported")
+
+    objective = learner["objective"]["name"]
+    num_class = int(learner["learner_model_param"]["num_class"])
+    n_groups = max(num_class, 1)
+    base_score = _parse_base_score(learner["learner_model_param"]["base_score"])
+
+    if objective in ("multi:softprob", "multi:softmax"):
+        output = "xgb_softprob"
+    elif objective == "binary:logistic":
+        output = "xgb_logistic"
+        base_score = -np.log(np.float32(1) / base_score - np.float32(1))
+    elif objective == "reg:squarederror":
+        output = "xgb_value"
+    else:
+        raise TypeError(f"Unsupported XGBoost objective {objective}")
+    base_margin = np.broadcast_to(base_score, (n_groups,)).astype(np.float32)
+
+    parts, roots, offset = [], [], 0
+    for tree in gradient_booster["model"]["trees"]:
+        part = _xgboost_tree_arrays(tree, offset)
+        parts.append(part)
+        roots.append(offset)
+        offset += len(part["feature"])
+
+    return CompiledTrees(
+        feature=_concat(parts, "feature"),
+        threshold=_concat(parts, "threshold").astype(np.float32),
+        left=_concat(parts, "left"),
+        right=_concat(parts, "right"),
+        default_left=_concat(parts, "default_left"),
+        leaf_value=_concat(parts, "value").astype(np.float32),
+        roots=roots,
+        strict=True,
+        input_dtype=np.float32,
+        output=output,
+        tree_group=np.array(gradient_booster["model"]["tree_info"], dtype=np.intp),
+        base_margin=base_margin,
+        feature_names=booster.feature_names,
+    )
+
+
+def compile_tree_model(model, feature_columns=None, float32_thresholds=False):
+    """Compile a fitted sklearn tree/forest or XGBoost model into CompiledTrees.
+
+    When feature_columns is given, the split features are remapped so the
+    compiled model reads arrays laid out in that column order.
+    """
+    model_type = type(model).__name__
+    if model_type in SKLEARN_FOREST_TYPES + SKLEARN_TREE_TYPES:
+        compiled = _compile_sklearn(model, float32_thresholds)
+    elif model_type in XGBOOST_TYPES:
+        compiled = _compile_xgboost(model)
+    else:
+        raise TypeError(f"Cannot compile models of type {model_type}")
+
+    if feature_columns is not None and compiled.feature_names is not None:
+        feature_columns = list(feature_columns)
+        missing = set(compiled.feature_names) - set(feature_columns)
+        if missing:
+            raise ValueError(f"Model features missing from the input: {missing}")
+        positions = np.array(
+            [feature_columns.index(name) for name in compiled.feature_names]
+        )
+        compiled.feature = positions[compiled.feature]
+        compiled.feature_names = feature_columns
+
+    return compiled
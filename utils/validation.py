@@ -0,0 +1,153 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.batch_io import json_loads
+from utils.preprocessing import FEATURE_COLUMNS
+from utils.student_schema import STUDENT_SCHEMA
+
+ID_FIELD = "StudentID"
+MAX_ERRORS = 100
+
+
+class InvalidJSONError(ValueError):
+    pass
+
+
+class ValidationError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(
+            "; ".join(f"{error['field']}: {error['error']}" for error in errors)
+        )
+
+
+def loads(body):
+    try:
+        return json_loads(body)
+    except ValueError as e:
+        raise InvalidJSONError(f"Invalid JSON body: {e}") from e
+
+
+def _error(field, message, record=None):
+    error = {"field": field, "error": message}
+    if record is not None:
+        error["record"] = record
+    return error
+
+
+class StudentValidator:
+    """Checks student records against STUDENT_SCHEMA before any preprocessing.
+
+    The checks are resolved once per feature column order. The feature
+    columns are required, the other schema fields are only checked when
+    present. Values must be JSON numbers (booleans and numeric strings are
+    rejected) within the schema range; StudentID is an identifier and has no
+    range. Valid records are written straight into the float64 feature array
+    of the preprocessing plan.
+    """
+
+    def __init__(self, feature_columns=None, schema=None):
+        self.feature_columns = list(feature_columns or FEATURE_COLUMNS)
+        schema = schema or STUDENT_SCHEMA
+        positions = {col: i for i, col in enumerate(self.feature_columns)}
+
+        self.checks = []
+        for field in list(schema) + [
+            col for col in self.feature_columns if col not in schema
+        ]:
+            _, low, high = schema.get(field, (None, -math.inf, math.inf))
+            if field == ID_FIELD:
+                low, high = -math.inf, math.inf
+            self.checks.append(
+                (
+                    field,
+                    field in positions,
+                    float(low),
+                    float(high),
+                    positions.get(field),
+                )
+            )
+
+    def record_errors(self, record, row, index=None):
+        if not isinstance(record, dict):
+            return [_error(None, "must be a JSON object", index)]
+
+        errors = []
+        for field, required, low, high, position in self.checks:
+            if field not in record:
+                if required:
+                    errors.append(_error(field, "is required", index))
+                continue
+            value = record[field]
+            # type() and not isinstance(), so True and False are rejected.
+            if type(value) not in (int, float):  # pylint: disable=unidiomatic-typecheck
+                errors.append(_error(field, "must be a number", index))
+            elif not low <= value <= high:
+                errors.append(
+                    _error(field, f"must be between {low:g} and {high:g}", index)
+                )
+            elif position is not None:
+                row[position] = value
+        return errors
+
+    def validate(self, record):
+        row = np.empty(len(self.feature_columns), dtype=np.float64)
+        errors = self.record_errors(record, row)
+        if errors:
+            raise ValidationError(errors)
+        return row
+
+    def validate_records(self, records):
+        features = np.empty((len(records), len(self.feature_columns)), np.float64)
+        errors = []
+        for i, record in enumerate(records):
+            errors.extend(self.record_errors(record, features[i], i))
+            if len(errors) >= MAX_ERRORS:
+                break
+        if errors:
+            raise ValidationError(errors[:MAX_ERRORS])
+        return features
+
+    def validate_frame(self, frame: pd.DataFrame):
+        errors = []
+        for field, required, low, high, _ in self.checks:
+            if field not in frame:
+                if required:
+                    errors.append(_error(field, "is required"))
+                continue
+            column = frame[field]
+            if not pd.api.types.is_numeric_dtype(column) or (
+                pd.api.types.is_bool_dtype(column)
+            ):
+                errors.append(_error(field, "must be a number"))
+                continue
+            values = column.to_numpy(dtype=np.float64)
+            invalid = int(np.count_nonzero(~((values >= low) & (values <= high))))
+            if invalid:
+                errors.append(
+                    _error(
+                        field,
+                        f"{invalid} values missing or not between {low:g} and {high:g}",
+                    )
+                )
+        if errors:
+            raise ValidationError(errors)
+
+        features = np.empty((len(frame), len(self.feature_columns)), np.float64)
+        for position, col in enumerate(self.feature_columns):
+            features[:, position] = frame[col].to_numpy()
+        return features
+
+
+@lru_cache(maxsize=8)
+def _validator(feature_columns):
+    return StudentValidator(feature_columns)
+
+
+def student_validator(feature_columns=None):
+    # One compiled validator per feature column order, as hot-reloaded plans
+    # may change it.
+    return _validator(tuple(feature_columns or FEATURE_COLUMNS))